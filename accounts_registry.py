@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+import serialization
+
+
+# Реестр аккаунтов в памяти поверх accounts.json.
+# Файл читается один раз и перечитывается только если его изменили извне (по mtime);
+# изменения сразу записываются на диск атомарно (временный файл + переименование).
+# Формат файла при чтении определяется автоматически, запись — в формате codec.
+class AccountRegistry:
+    # Как часто (в секундах) проверять mtime файла
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, path, codec='json'):
+        self.path = path
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._accounts = {}
+        self._mtime = None
+        self._checked_at = None
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        mtime = self._file_mtime()
+        if mtime == self._mtime:
+            return
+        try:
+            self._accounts = serialization.load(self.path)
+        except FileNotFoundError:
+            self._accounts = {}
+        self._mtime = mtime
+
+    def _save(self):
+        serialization.dump(self._accounts, self.path, self.codec)
+        self._mtime = self._file_mtime()
+
+    def __contains__(self, phone):
+        with self._lock:
+            self._refresh()
+            return phone in self._accounts
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._accounts)
+
+    def get(self, phone):
+        with self._lock:
+            self._refresh()
+            return self._accounts.get(phone)
+
+    # Копия всех аккаунтов: телефон -> данные
+    def all(self):
+        with self._lock:
+            self._refresh()
+            return dict(self._accounts)
+
+    def add(self, phone, data):
+        with self._lock:
+            self._refresh()
+            self._accounts[phone] = data
+            self._save()
+
+    # Удаление аккаунта, возвращает False, если его не было
+    def remove(self, phone):
+        with self._lock:
+            self._refresh()
+            if phone not in self._accounts:
+                return False
+            del self._accounts[phone]
+            self._save()
+            return True
@@ -0,0 +1,44 @@
+# Сравнение памяти: словари из orders.json против колоночного OrderStore.
+#
+#   python benchmarks/bench_memory.py --orders 300000
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import generate_history_json  # noqa: E402
+from orders_store import OrderStore  # noqa: E402
+
+
+def measure(factory):
+    gc.collect()
+    tracemalloc.start()
+    obj = factory()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, current
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=100_000)
+    args = parser.parse_args()
+
+    text = generate_history_json(args.orders)
+    raw, dict_bytes = measure(lambda: json.loads(text))
+    store, store_bytes = measure(lambda: OrderStore.from_dict(json.loads(text)))
+    assert store.to_dict() == raw
+
+    print(f"Заявок: {args.orders}")
+    print(f"dict (orders.json): {dict_bytes / 2 ** 20:8.1f} МБ")
+    print(f"OrderStore:         {store_bytes / 2 ** 20:8.1f} МБ")
+    print(f"Экономия:           {dict_bytes / store_bytes:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+# Стоимость разбора сообщения в зависимости от числа зарегистрированных форматов заявок.
+# Сравнивается реестр order_parsers (один проход по маркерам) с перебором всех форматов подряд.
+# Перед замером проверяется, что реестр разбирает так же, как перебор.
+#
+#   python benchmarks/bench_parsers.py --messages 50000
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generator import city_name, address_name, generate_messages  # noqa: E402
+from order_parsers import DEFAULT_FORMAT, OrderFormat, ParserRegistry  # noqa: E402
+
+# Подписи полей дополнительных форматов: город, адрес, кол-во людей, оплата, начало.
+# Как и в настоящих чатах, многие подписи («Адрес:», «Оплата:») у форматов общие.
+LAYOUTS = [
+    ('📍 Город:', 'Адрес:', 'Требуется человек:', 'Оплата:', 'Старт:'),
+    ('Населённый пункт:', 'Адрес:', 'Кол-во грузчиков:', 'Оплата:', 'Время начала:'),
+    ('#город', 'Адрес:', '#люди', 'Оплата:', '#начало'),
+    ('🏙', 'Адрес:', '👷', 'Ставка:', '⏰'),
+    ('ГОРОД:', 'АДРЕС:', 'ЛЮДЕЙ:', 'ОПЛАТА:', 'КОГДА:'),
+    ('Город —', 'Адрес —', 'Нужно —', 'Оплата —', 'Начинаем —'),
+    ('[Город]', 'Адрес:', '[Бригада]', 'Оплата:', '[Начало]'),
+    ('City:', 'Address:', 'Workers:', 'Rate:', 'Start:'),
+    ('Локация:', 'Адрес:', 'Состав:', 'Оплата:', 'Сбор:'),
+    ('Регион:', 'Склад:', 'Нужны:', 'Оплата:', 'Выход:'),
+    ('г.', 'Адрес:', 'нужно людей', 'руб/час', 'начало работ'),
+]
+
+
+# Подписи для форматов сверх LAYOUTS (для замеров на большом числе форматов)
+def extra_layout(index):
+    return (f'Город №{index}:', 'Адрес:', f'Людей (бригада {index}):', 'Оплата:', f'Начало смены {index}:')
+
+
+def layout_format(index, labels):
+    city, address, count, payment, start = labels
+    return OrderFormat(
+        f'layout_{index}',
+        markers=labels,
+        patterns={
+            'city': re.escape(city) + r'\s*(?P<city>[^\n]+)',
+            'address': re.escape(address) + r'\s*(?P<address>[^\n]+)',
+            'body_count': re.escape(count) + r'\s*(?P<body_count>\d+)',
+            'paid_amount': re.escape(payment) + r'\s*(?P<paid_amount>\d+)',
+            'start': re.escape(start) + r'\s*(?P<start>[^\n]+)',
+        },
+    )
+
+
+def layout_message(labels, rnd):
+    city, address, count, payment, start = labels
+    return (f"Новая заявка\n{city} {city_name(rnd.randrange(10))}\n{address} {address_name(rnd.randrange(40))}\n"
+            f"{count} {rnd.randint(1, 12)}\n{payment} {rnd.choice([300, 400, 500])}\n{start} завтра в 9:00")
+
+
+def registry_with(formats):
+    registry = ParserRegistry()
+    for order_format in formats:
+        registry.register(order_format)
+    return registry
+
+
+# Разбор перебором: каждый формат пробует свои выражения, пока один не подойдёт
+def parse_sequential(formats, text):
+    for order_format in formats:
+        result = order_format.extract(text)
+        if result is not None:
+            return order_format.name, result
+    return None
+
+
+# Якоря форматов могут перекрываться в тексте: в «Заказ № смены» есть и «Заказ №», и «№ смены»,
+# и реестр должен найти оба, а не только первый
+def check_overlapping_anchors():
+    orders = layout_format('orders', ('Заказ №', 'Адрес:', 'Людей:', 'Оплата:', 'Начало:'))
+    shifts = layout_format('shifts', ('№ смены', 'Адрес:', 'Людей:', 'Оплата:', 'Старт:'))
+    text = "Заказ № смены 17\nАдрес: Складская 5\nЛюдей: 4\nОплата: 400\nСтарт: завтра в 9:00"
+    registry = registry_with([orders, shifts])
+    assert registry.candidates(text) == (orders, shifts)
+    assert registry.parse(text) == parse_sequential([orders, shifts], text) == ('layout_shifts', {
+        'city': '17', 'address': 'Складская 5', 'body_count': 4, 'paid_amount': 400, 'start': 'завтра в 9:00'})
+
+
+def per_message(parse, messages):
+    start = time.perf_counter()
+    for text in messages:
+        parse(text)
+    return (time.perf_counter() - start) / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=50_000)
+    parser.add_argument('--formats', type=int, default=50, help="максимальное число форматов в замере")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    layouts = LAYOUTS + [extra_layout(i) for i in range(max(0, args.formats - 1 - len(LAYOUTS)))]
+    formats = [DEFAULT_FORMAT] + [layout_format(i, labels) for i, labels in enumerate(layouts)]
+    # Основной формат (с 10% сообщений без заявки) и поровну с ним сообщения остальных форматов.
+    # В смеси есть форматы, которые в небольших реестрах не зарегистрированы (такие сообщения не разбираются).
+    default_messages = generate_messages(args.messages, seed=args.seed)
+    mixed_messages = [
+        default_messages[i] if i % 2 == 0 else layout_message(layouts[rnd.randrange(len(layouts))], rnd)
+        for i in range(args.messages)
+    ]
+
+    check_overlapping_anchors()
+    full = registry_with(formats)
+    assert all(full.parse(text) == parse_sequential(formats, text) for text in mixed_messages[:5000])
+
+    print(f"Сообщений: {args.messages}, мкс на сообщение")
+    print(f"{'форматов':>9} {'основной: реестр':>18} {'основной: перебор':>18} {'смесь: реестр':>15} {'смесь: перебор':>16}")
+    for count in sorted({count for count in (1, 3, 6, 12, 25, 50) if count < len(formats)} | {len(formats)}):
+        subset = formats[:count]
+        registry = registry_with(subset)
+        print(f"{count:>9} "
+              f"{per_message(registry.parse, default_messages):18.2f} "
+              f"{per_message(lambda text: parse_sequential(subset, text), default_messages):18.2f} "
+              f"{per_message(registry.parse, mixed_messages):15.2f} "
+              f"{per_message(lambda text: parse_sequential(subset, text), mixed_messages):16.2f}")
+
+
+if __name__ == '__main__':
+    main()
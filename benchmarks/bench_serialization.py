@@ -0,0 +1,58 @@
+# Время сохранения и загрузки orders.json и размер файла в разных форматах на большой истории.
+#
+#   python benchmarks/bench_serialization.py --orders 300000
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization  # noqa: E402
+from generator import generate_history  # noqa: E402
+from orders_store import OrderStore  # noqa: E402
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--orders', type=int, default=300_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    store = OrderStore.from_dict(generate_history(args.orders, days=90, seed=args.seed))
+    expected = store.to_dict()
+
+    # (подпись, кодек, использовать orjson); json без orjson — тот же формат через стандартный json
+    variants = [('json-indent (как раньше)', 'json-indent', False), ('json', 'json', False)]
+    if serialization.orjson is not None:
+        variants.append(('json + orjson', 'json', True))
+    if serialization.msgpack is not None:
+        variants.append(('msgpack', 'msgpack', True))
+
+    orjson = serialization.orjson
+    print(f"Заявок: {args.orders}")
+    print(f"{'формат':<26} {'запись, с':>10} {'чтение, с':>10} {'размер, МБ':>11}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for title, codec, use_orjson in variants:
+            serialization.orjson = orjson if use_orjson else None
+            path = os.path.join(workdir, f"orders.{codec}")
+            save = best_of(lambda: store.save(path, codec), args.repeat)
+            load = best_of(lambda: OrderStore.load(path), args.repeat)
+            assert OrderStore.load(path).to_dict() == expected
+            print(f"{title:<26} {save:10.3f} {load:10.3f} {os.path.getsize(path) / 2 ** 20:11.1f}")
+    serialization.orjson = orjson
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Бенчмарки разбора заявок, расчёта отчётов и сохранения заявок на синтетических данных.
+# Результаты можно сохранить как базовые и сравнивать с ними последующие прогоны.
+#
+#   python benchmarks/bench_suite.py                                    # 10k, 100k и 1M заявок
+#   python benchmarks/bench_suite.py --sizes 10000 100000 --save benchmarks/baselines/baseline.json
+#   python benchmarks/bench_suite.py --sizes 10000 100000 --compare benchmarks/baselines/baseline.json
+#
+# При сравнении медиана каждого замера сравнивается с базовой; если замедление больше
+# --threshold (по умолчанию 20%), скрипт завершается с кодом 1.
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generator import HISTORY_END, generate_history, generate_messages  # noqa: E402
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+# bot.py читает настройки из окружения и пишет свои файлы в текущий каталог,
+# поэтому импортируем его во временном каталоге с тестовыми настройками
+def import_bot(workdir):
+    os.environ.setdefault('BOT_TOKEN', '123456:benchmark')
+    os.environ.setdefault('ADMINS', '1')
+    os.environ.setdefault('ACCESS_CODE', 'benchmark')
+    os.chdir(workdir)
+    import bot
+    return bot
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(samples, items):
+    total = sum(samples)
+    return {
+        'calls': len(samples),
+        'items': items,
+        'median': statistics.median(samples),
+        'p99': percentile(samples, 0.99),
+        'throughput': items / total if total else 0.0,
+    }
+
+
+# Время каждого вызова fn(); items — сколько заявок (сообщений) обрабатывает вся серия вызовов
+def measure(fn, repeat, items):
+    gc.collect()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, items)
+
+
+def bench_parse(bot, size, args):
+    messages = generate_messages(size, args.cities, args.addresses, args.duplicates, seed=args.seed)
+    parse = bot.parse_order_message
+    gc.collect()
+    samples = []
+    for text in messages:
+        start = time.perf_counter()
+        parse(text)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, size)
+
+
+def bench_size(bot, size, args):
+    results = {'parse_order_message': bench_parse(bot, size, args)}
+
+    raw = generate_history(size, args.chats, args.cities, args.addresses, args.duplicates, args.days, args.seed)
+    store = bot.OrderStore.from_dict(raw)
+    del raw
+    end_date = HISTORY_END
+    start_date = end_date - timedelta(days=args.period_days)
+
+    results['sum_orders_from_all_cities'] = measure(
+        lambda: bot.sum_orders_from_all_cities(store), args.repeat, size * args.repeat)
+    data = bot.sum_orders_from_all_cities(store)
+    results['process_data'] = measure(
+        lambda: bot.process_data(data, start_date, end_date), args.repeat, size * args.repeat)
+    report = bot.process_data(data, start_date, end_date)
+    results['generate_report'] = measure(
+        lambda: bot.generate_report(report), args.repeat, size * args.repeat)
+    results['save_orders'] = measure(
+        lambda: bot.save_orders(store), args.repeat, size * args.repeat)
+    return results
+
+
+def compare(results, baseline, threshold):
+    if baseline.get('params') != results['params']:
+        print("Внимание: параметры генерации отличаются от базовых, сравнение может быть некорректным")
+    if baseline.get('environment') != results['environment']:
+        print("Внимание: окружение (Python, платформа, движок отчётов) отличается от базового")
+    regressions = []
+    print(f"{'замер':<42} {'база, мс':>12} {'сейчас, мс':>12} {'изменение':>10}")
+    for key, current in results['results'].items():
+        base = baseline['results'].get(key)
+        if base is None or base['median'] == 0:
+            continue
+        ratio = current['median'] / base['median']
+        mark = ''
+        if ratio > 1 + threshold:
+            mark = '  <-- регрессия'
+            regressions.append(key)
+        print(f"{key:<42} {base['median'] * 1000:12.3f} {current['median'] * 1000:12.3f} "
+              f"{(ratio - 1) * 100:+9.1f}%{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--cities', type=int, default=10)
+    parser.add_argument('--addresses', type=int, default=200, help="адресов в каждом городе")
+    parser.add_argument('--duplicates', type=float, default=0.1, help="доля повторных заявок")
+    parser.add_argument('--days', type=int, default=90, help="глубина истории (дней)")
+    parser.add_argument('--period-days', type=int, default=7, help="период отчёта (дней)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', help="сохранить результаты в JSON (базовые значения)")
+    parser.add_argument('--compare', help="сравнить с базовыми значениями из JSON")
+    parser.add_argument('--threshold', type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = import_bot(workdir)
+        try:
+            results = {
+                'params': {name: getattr(args, name) for name in
+                           ('chats', 'cities', 'addresses', 'duplicates', 'days', 'period_days', 'seed')},
+                'environment': {
+                    'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'report_engine': bot.REPORT_ENGINE,
+                },
+                'results': {},
+            }
+            for size in args.sizes:
+                for name, result in bench_size(bot, size, args).items():
+                    key = f"{name}/{size}"
+                    results['results'][key] = result
+                    print(f"{key:<42} медиана {result['median'] * 1000:10.3f} мс, p99 {result['p99'] * 1000:10.3f} мс, "
+                          f"{result['throughput']:12.0f} заявок/с")
+        finally:
+            bot.log_listener.stop()
+            os.chdir(ROOT)
+
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=4)
+    if compare_path:
+        with open(compare_path, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"Регрессии: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# Синтетические данные для бенчмарков: тексты заявок в формате чатов и истории orders.json.
+# Генерация детерминирована: при одном seed и одних параметрах данные всегда одинаковые.
+import json
+import random
+from datetime import datetime, timedelta
+
+# Конец истории; период отчётов в бенчмарках считается от этой даты
+HISTORY_END = datetime(2024, 11, 1)
+
+CITY_NAMES = ['Москва', 'Санкт-Петербург', 'Казань', 'Новосибирск', 'Екатеринбург', 'Нижний Новгород',
+              'Самара', 'Ростов-на-Дону', 'Краснодар', 'Воронеж', 'Пермь', 'Уфа']
+STREET_NAMES = ['ул. Ленина', 'пр. Мира', 'ул. Садовая', 'ул. Заводская', 'Складской пр.',
+                'ул. Промышленная', 'ш. Энтузиастов', 'ул. Гагарина']
+CHAT_KINDS = ['Грузчики', 'Разгрузчики', 'Атлант', 'Артель', 'Работа']
+PAYMENTS = [300, 350, 400, 450, 500, 600]
+
+
+def city_name(index):
+    name = CITY_NAMES[index % len(CITY_NAMES)]
+    return name if index < len(CITY_NAMES) else f"{name} {index // len(CITY_NAMES) + 1}"
+
+
+def address_name(index):
+    return f"{STREET_NAMES[index % len(STREET_NAMES)]}, {index // len(STREET_NAMES) + 1}"
+
+
+# Фраза «Начало:» как её пишут в чатах
+def start_phrase(rnd):
+    kind = rnd.random()
+    if kind < 0.4:
+        return f"сегодня в {rnd.randint(6, 20)}:{rnd.choice(['00', '30'])}"
+    if kind < 0.75:
+        return f"завтра в {rnd.randint(6, 20)}:{rnd.choice(['00', '30'])}"
+    if kind < 0.9:
+        return rnd.choice(['в ближайшее время', 'в_ближайшее_время', 'срочно, в ближайшее время'])
+    return f"{rnd.randint(1, 28)}.{rnd.randint(1, 12):02d} в {rnd.randint(6, 20)}:00"
+
+
+# Текст сообщения с заявкой, который разбирает parse_order_message
+def order_message(city, address, needed, total, paid_amount, start):
+    return (
+        f"🔥 Новая заявка\n"
+        f"• {city}: требуются грузчики\n"
+        f"Адрес: 👉 {address}\n"
+        f"Нужен {needed}/{total}\n"
+        f"Оплата: {paid_amount} ₽/час\n"
+        f"Начало: {start}\n"
+        f"Пишите в личные сообщения"
+    )
+
+
+# Поток заявок: (номер чата, город, адрес, время, кол-во людей, оплата, фраза начала).
+# duplicates — доля заявок, повторяющих предыдущую заявку того же адреса через несколько минут
+# (такие заявки отчёт должен отбросить как дубликаты).
+def generate_orders(orders_count, chats=5, cities=10, addresses=40, duplicates=0.1, days=30, seed=1,
+                    end=HISTORY_END):
+    rnd = random.Random(seed)
+    start = end - timedelta(days=days)
+    step = days * 24 * 60 * 60 / max(orders_count, 1)
+    last_by_address = {}
+    for i in range(orders_count):
+        moment = start + timedelta(seconds=int(i * step))
+        chat = rnd.randrange(chats)
+        city = city_name(rnd.randrange(cities))
+        address = address_name(rnd.randrange(addresses))
+        previous = last_by_address.get((chat, city, address))
+        if previous is not None and rnd.random() < duplicates:
+            body_count, paid_amount, phrase = previous
+        else:
+            body_count, paid_amount, phrase = rnd.randint(1, 12), rnd.choice(PAYMENTS), start_phrase(rnd)
+        last_by_address[(chat, city, address)] = (body_count, paid_amount, phrase)
+        yield chat, city, address, moment, body_count, paid_amount, phrase
+
+
+# Тексты сообщений из чатов; noise — доля сообщений без заявки
+def generate_messages(messages_count, cities=10, addresses=40, duplicates=0.1, noise=0.1, seed=1):
+    rnd = random.Random(seed + 1)
+    messages = []
+    orders = generate_orders(messages_count, 1, cities, addresses, duplicates, 1, seed)
+    for _, city, address, _, body_count, paid_amount, phrase in orders:
+        if rnd.random() < noise:
+            messages.append(rnd.choice(['Заявка закрыта', 'Всем спасибо!', 'Кто свободен завтра?',
+                                        f'Адрес: 👉 {address}, уточняю время']))
+            continue
+        messages.append(order_message(city, address, rnd.randint(0, body_count), body_count, paid_amount, phrase))
+    return messages
+
+
+# История в формате orders.json (словарь, как после json.load)
+def generate_history(orders_count, chats=5, cities=10, addresses=40, duplicates=0.1, days=30, seed=1,
+                     end=HISTORY_END):
+    raw = {}
+    for chat, city, address, moment, body_count, paid_amount, phrase in generate_orders(
+            orders_count, chats, cities, addresses, duplicates, days, seed, end):
+        chat_data = raw.setdefault(str(1000 + chat), {
+            'streets': {}, 'chat_name': f'{CHAT_KINDS[chat % len(CHAT_KINDS)]} {chat + 1}'})
+        chat_data['streets'].setdefault(city, {}).setdefault(address, []).append({
+            'body_count': body_count,
+            'paid_amount': paid_amount,
+            'datetime': moment.strftime("%Y.%m.%d %H:%M:%S"),
+            'start': phrase,
+        })
+    return raw
+
+
+def generate_history_json(orders_count, **kwargs):
+    return json.dumps(generate_history(orders_count, **kwargs), ensure_ascii=False)
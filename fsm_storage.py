@@ -0,0 +1,86 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+
+# Хранилище состояний FSM в SQLite: переживает перезапуск бота и может использоваться
+# несколькими процессами бота одновременно (режим WAL). Данные состояния хранятся в JSON,
+# поэтому в них можно класть только сериализуемые значения (не объекты клиентов и т.п.).
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, ttl: Optional[float] = None):
+        self.path = path
+        # Через сколько секунд без изменений брошенный сценарий удаляется
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, "
+            "state TEXT, "
+            "data TEXT NOT NULL DEFAULT '{}', "
+            "updated_at REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    def _execute(self, *statements):
+        with self._lock:
+            cursor = None
+            for query, params in statements:
+                cursor = self._connection.execute(query, params)
+            return cursor.fetchall(), cursor.rowcount
+
+    # Запросы выполняются в отдельном потоке, чтобы не блокировать цикл событий
+    async def _run(self, *statements):
+        return await asyncio.to_thread(self._execute, *statements)
+
+    # Запись без состояния и данных не нужна — удаляем её, чтобы таблица не росла
+    def _drop_empty(self, key):
+        return "DELETE FROM fsm WHERE key = ? AND state IS NULL AND data = '{}'", (key,)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        key = self._key(key)
+        await self._run(
+            ("INSERT INTO fsm (key, state, updated_at) VALUES (?, ?, ?) "
+             "ON CONFLICT(key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+             (key, state, time.time())),
+            self._drop_empty(key),
+        )
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        rows, _ = await self._run(("SELECT state FROM fsm WHERE key = ?", (self._key(key),)))
+        return rows[0][0] if rows else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        key = self._key(key)
+        await self._run(
+            ("INSERT INTO fsm (key, data, updated_at) VALUES (?, ?, ?) "
+             "ON CONFLICT(key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+             (key, json.dumps(data, ensure_ascii=False), time.time())),
+            self._drop_empty(key),
+        )
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        rows, _ = await self._run(("SELECT data FROM fsm WHERE key = ?", (self._key(key),)))
+        return json.loads(rows[0][0]) if rows else {}
+
+    # Удаление брошенных сценариев старше ttl, возвращает кол-во удалённых
+    async def cleanup(self) -> int:
+        if self.ttl is None:
+            return 0
+        _, deleted = await self._run(("DELETE FROM fsm WHERE updated_at < ?", (time.time() - self.ttl,)))
+        return deleted
+
+    async def close(self) -> None:
+        with self._lock:
+            self._connection.close()
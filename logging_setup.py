@@ -0,0 +1,64 @@
+import logging
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+# Ограничение повторяющихся сообщений: не больше burst одинаковых записей за interval секунд.
+# Одинаковыми считаются записи одного логгера с одним шаблоном сообщения и ключом rate_key
+# (передаётся через extra, например телефон аккаунта). Остальные отбрасываются, а их количество
+# дописывается к первой записи следующего интервала.
+class RateLimitFilter(logging.Filter):
+    # Предел числа отслеживаемых ключей, чтобы словарь не рос бесконечно
+    MAX_KEYS = 10000
+
+    def __init__(self, interval=60.0, burst=5, min_level=logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.min_level = min_level
+        self._windows = {}
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.msg, getattr(record, 'rate_key', None))
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            suppressed = window[2] if window is not None else 0
+            if len(self._windows) >= self.MAX_KEYS:
+                self._windows.clear()
+            self._windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} (похожих сообщений пропущено: {suppressed})"
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+# Логи пишутся в очередь, а в stdout их выводит отдельный поток: цикл событий не ждёт ввода-вывода.
+# level задаёт уровень логгеров бота ("bot.*"), у библиотек остаётся WARNING.
+def setup_logging(level="INFO") -> QueueListener:
+    queue = SimpleQueue()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = QueueListener(queue, stream_handler)
+
+    queue_handler = QueueHandler(queue)
+    queue_handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(logging.WARNING)
+    logging.getLogger("bot").setLevel(level.upper() if isinstance(level, str) else level)
+
+    listener.start()
+    return listener
@@ -0,0 +1,144 @@
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+
+# Границы корзин гистограмм задержек (секунды)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Счётчик с метками. inc() — одна операция со словарём, без блокировок (всё в одном цикле событий).
+class Counter:
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def total(self):
+        return sum(self._values.values())
+
+    def render(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_labels(self.labelnames, labels)} {value}"
+
+
+# Гистограмма с метками: на каждое наблюдение — бинарный поиск корзины и пара сложений
+class Histogram:
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [кол-во по корзинам (последняя — +Inf), сумма, кол-во]
+        self._values = {}
+
+    def observe(self, value, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    # Замер времени блока: with histogram.time(account, chat): ...
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    # Сводка по всем меткам: кол-во, среднее и оценка квантиля по границам корзин
+    def summary(self, quantile=0.95):
+        counts = [0] * (len(self.buckets) + 1)
+        total_sum, total_count = 0.0, 0
+        for bucket_counts, value_sum, count in self._values.values():
+            counts = [a + b for a, b in zip(counts, bucket_counts)]
+            total_sum += value_sum
+            total_count += count
+        if total_count == 0:
+            return 0, 0.0, 0.0
+        threshold, cumulative = quantile * total_count, 0
+        estimate = float('inf')
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            if cumulative >= threshold:
+                estimate = bound
+                break
+        return total_count, total_sum / total_count, estimate
+
+    def render(self):
+        for labels, (bucket_counts, value_sum, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', bound)])} {cumulative}"
+            yield f"{self.name}_bucket{_labels(self.labelnames, labels, [('le', '+Inf')])} {count}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {value_sum}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {count}"
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    # Текстовый формат Prometheus
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Локальный HTTP-сервер с /metrics, возвращает runner для остановки
+async def start_metrics_server(registry, host, port):
+    async def handle_metrics(request):
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
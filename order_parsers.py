@@ -0,0 +1,166 @@
+import re
+
+# Поля заявки, которые должен вернуть формат; числовые приводятся к int
+ORDER_FIELDS = ('city', 'address', 'body_count', 'paid_amount', 'start')
+_INT_FIELDS = ('body_count', 'paid_amount')
+
+
+# Формат сообщения с заявкой. markers — литеральные подстроки, которые обязательно есть в каждом
+# сообщении этого формата (по ним выбираются форматы-кандидаты), patterns — регулярные выражения
+# полей, у каждого группа с именем поля: {'body_count': r'Нужен\s*\d+/(?P<body_count>\d+)', ...}.
+# Для нестандартного разбора можно унаследоваться и переопределить extract().
+class OrderFormat:
+    def __init__(self, name, markers, patterns):
+        if not markers:
+            raise ValueError(f"Формат {name}: нужен хотя бы один маркер")
+        missing = [field for field in ORDER_FIELDS if field not in patterns]
+        if missing:
+            raise ValueError(f"Формат {name}: нет шаблонов для полей {', '.join(missing)}")
+        self.name = name
+        self.markers = tuple(markers)
+        self.patterns = [(field, re.compile(patterns[field])) for field in ORDER_FIELDS]
+
+    def extract(self, text):
+        result = {}
+        for field, pattern in self.patterns:
+            match = pattern.search(text)
+            if match is None:
+                return None
+            value = match.group(field)
+            result[field] = int(value) if field in _INT_FIELDS else value.strip()
+        return result
+
+
+# Регулярное выражение из префиксного дерева маркеров: общие префиксы проверяются один раз,
+# поэтому поиск по тексту почти не замедляется с ростом числа маркеров
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        group = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # Маркер закончился, но есть более длинные: жадно берём длинный, короткий учтётся через _nested
+            return '(?:' + group + ')?'
+        return group
+
+    return re.compile(build(trie))
+
+
+# Реестр форматов. Каждый формат представлен в общем выражении одним «якорным» маркером — самым
+# редким среди форматов (при равенстве самым длинным). Сообщение просматривается этим выражением
+# один раз, и разбираются только форматы с найденными якорями (в порядке регистрации). Если таких
+# форматов несколько, перед разбором у каждого проверяются и остальные маркеры.
+# Если формат один, общее выражение не нужно: достаточно проверить его якорь как подстроку.
+class ParserRegistry:
+    # Предел кэша «набор найденных якорей -> форматы»
+    MAX_CACHED = 4096
+
+    def __init__(self):
+        self.formats = []
+        self._scanner = None
+        # (формат, якорь), если зарегистрирован ровно один формат
+        self._single = None
+        # якорь -> номера форматов
+        self._by_anchor = {}
+        # найденный якорь -> якоря, с которых он начинается (с одной позиции поиск берёт только длинный)
+        self._nested = {}
+        self._cache = {}
+
+    def register(self, order_format):
+        if any(registered.name == order_format.name for registered in self.formats):
+            raise ValueError(f"Формат {order_format.name} уже зарегистрирован")
+        self.formats.append(order_format)
+        self._rebuild()
+        return order_format
+
+    def _rebuild(self):
+        usage = {}
+        for order_format in self.formats:
+            for marker in set(order_format.markers):
+                usage[marker] = usage.get(marker, 0) + 1
+        self._by_anchor = {}
+        for index, order_format in enumerate(self.formats):
+            anchor = min(order_format.markers, key=lambda marker: (usage[marker], -len(marker)))
+            self._by_anchor.setdefault(anchor, []).append(index)
+        anchors = list(self._by_anchor)
+        self._scanner = _trie_pattern(anchors)
+        self._nested = {}
+        for anchor in anchors:
+            inner = [other for other in anchors if other != anchor and anchor.startswith(other)]
+            if inner:
+                self._nested[anchor] = inner
+        self._cache = {}
+        self._single = (self.formats[0], anchors[0]) if len(self.formats) == 1 else None
+
+    def candidates(self, text):
+        if self._scanner is None:
+            return ()
+        # Следующий поиск начинается со второго символа найденного маркера, а не после него,
+        # чтобы не пропустить перекрывающиеся маркеры («Заказ №» и «№ смены» в «Заказ № смены»)
+        found = []
+        search = self._scanner.search
+        match = search(text)
+        while match is not None:
+            found.append(match.group())
+            match = search(text, match.start() + 1)
+        if not found:
+            return ()
+        key = frozenset(found)
+        candidates = self._cache.get(key)
+        if candidates is None:
+            anchors = set(key)
+            for anchor in key:
+                anchors.update(self._nested.get(anchor, ()))
+            indexes = sorted({index for anchor in anchors for index in self._by_anchor[anchor]})
+            candidates = tuple(self.formats[index] for index in indexes)
+            if len(self._cache) >= self.MAX_CACHED:
+                self._cache.clear()
+            self._cache[key] = candidates
+        return candidates
+
+    # Имя формата и поля заявки, либо None, если ни один формат не подошёл
+    def parse(self, text):
+        if self._single is not None:
+            order_format, anchor = self._single
+            if anchor not in text:
+                return None
+            result = order_format.extract(text)
+            return None if result is None else (order_format.name, result)
+        candidates = self.candidates(text)
+        for order_format in candidates:
+            if len(candidates) > 1 and not all(marker in text for marker in order_format.markers):
+                continue
+            result = order_format.extract(text)
+            if result is not None:
+                return order_format.name, result
+        return None
+
+
+# Основной формат чатов диспетчеров:
+# • Город: ...
+# Адрес: 👉 ...
+# Нужен 1/4
+# Оплата: 400 ₽/час
+# Начало: ...
+DEFAULT_FORMAT = OrderFormat(
+    'default',
+    markers=('•', 'Адрес:', 'Нужен', 'Оплата:', 'Начало:'),
+    patterns={
+        'city': r'•\s*(?P<city>.*?):',
+        'address': r'Адрес:\s*👉\s*(?P<address>.*?)(?=\n|$)',
+        'body_count': r'Нужен\s*\d+/(?P<body_count>\d+)',
+        'paid_amount': r'Оплата:\s*(?P<paid_amount>\d+)\s*₽/час',
+        'start': r'Начало:\s*(?P<start>.*?)(?=\n|$)',
+    },
+)
+
+registry = ParserRegistry()
+registry.register(DEFAULT_FORMAT)
@@ -0,0 +1,149 @@
+import gzip
+import json
+import logging
+import os
+import re
+import zlib
+
+import serialization
+from orders_store import OrderStore, format_timestamp, from_timestamp, parse_timestamp
+
+# Архив заявок: по месяцам, одна заявка на строку (JSON Lines, gzip). Каждый перенос пишет по
+# отдельному файлу-части на месяц: orders_ГГГГ-ММ_<cutoff>.jsonl.gz. Файлы без части
+# (orders_ГГГГ-ММ.jsonl.gz) остались от прежней дозаписи и читаются так же.
+ARCHIVE_FILE_PATTERN = re.compile(r'^orders_(\d{4})-(\d{2})(?:_(\d+))?\.jsonl\.gz$')
+
+logger = logging.getLogger("bot.storage")
+
+
+def archive_file_name(year, month, batch):
+    return f"orders_{year:04d}-{month:02d}_{batch}.jsonl.gz"
+
+
+# Состояние архива: до какого момента заявки уже перенесены (archived_until) и, пока идёт запись,
+# до какого момента переносятся сейчас (pending_until)
+ARCHIVE_STATE_FILE = 'archive_state.json'
+
+
+def _load_state(archive_dir):
+    try:
+        return serialization.load(os.path.join(archive_dir, ARCHIVE_STATE_FILE))
+    except FileNotFoundError:
+        return {}
+
+
+def _save_state(archive_dir, state):
+    serialization.dump(state, os.path.join(archive_dir, ARCHIVE_STATE_FILE))
+
+
+# Части, записанные переносом с данным cutoff
+def _batch_files(archive_dir, batch):
+    files = []
+    for name in os.listdir(archive_dir):
+        match = ARCHIVE_FILE_PATTERN.match(name)
+        if match is not None and match.group(3) == str(batch):
+            files.append(os.path.join(archive_dir, name))
+    return files
+
+
+# Атомарная запись части: временный файл, fsync и переименование — после сбоя на диске
+# остаётся либо вся часть, либо ничего
+def _write_part(path, lines):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as raw:
+        with gzip.open(raw, 'wt', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+
+# Перенос заявок раньше cutoff в архив. Перенос идемпотентен:
+# - заявки раньше archived_until уже в архиве и пропускаются;
+# - если прошлый перенос прервался (в состоянии остался pending_until), его части удаляются
+#   и пишутся заново — эти заявки ещё лежат в orders.json, так как удаляются оттуда только после переноса.
+def write_archive(store: OrderStore, archive_dir, cutoff):
+    os.makedirs(archive_dir, exist_ok=True)
+    state = _load_state(archive_dir)
+    archived_until = state.get('archived_until')
+    pending_until = state.get('pending_until')
+    if pending_until is not None:
+        for path in _batch_files(archive_dir, pending_until):
+            os.remove(path)
+
+    months = {}
+    for chat_id, chat in store.items():
+        for city, addresses in chat.streets.items():
+            for address, orders in addresses.items():
+                for timestamp, body_count, paid_amount, start in orders:
+                    if timestamp >= cutoff or (archived_until is not None and timestamp < archived_until):
+                        continue
+                    date = from_timestamp(timestamp)
+                    months.setdefault((date.year, date.month), []).append(json.dumps({
+                        'chat_id': chat_id,
+                        'chat_name': chat.chat_name,
+                        'city': city,
+                        'address': address,
+                        'body_count': body_count,
+                        'paid_amount': paid_amount,
+                        'datetime': format_timestamp(timestamp),
+                        'start': start,
+                    }, ensure_ascii=False))
+
+    _save_state(archive_dir, {'archived_until': archived_until, 'pending_until': cutoff})
+    for (year, month), lines in months.items():
+        _write_part(os.path.join(archive_dir, archive_file_name(year, month, cutoff)), lines)
+    _save_state(archive_dir, {'archived_until': max(cutoff, archived_until or cutoff)})
+    return sum(len(lines) for lines in months.values())
+
+
+# Строки архивного файла. Файл прежней дозаписи мог оборваться на середине блока gzip при сбое:
+# тогда читается всё до обрыва, а недописанная строка отбрасывается.
+def _read_lines(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                if line.strip():
+                    yield line
+        except (EOFError, gzip.BadGzipFile, zlib.error):
+            logger.warning("Архив %s оборван, прочитаны заявки до места обрыва", path)
+
+
+# Архивные файлы, месяцы которых пересекаются с периодом [start_ts, end_ts]
+def archive_files(archive_dir, start_ts, end_ts):
+    try:
+        names = sorted(os.listdir(archive_dir))
+    except FileNotFoundError:
+        return []
+    start, end = from_timestamp(start_ts), from_timestamp(end_ts)
+    files = []
+    for name in names:
+        match = ARCHIVE_FILE_PATTERN.match(name)
+        if match is None:
+            continue
+        month = (int(match.group(1)), int(match.group(2)))
+        if (start.year, start.month) <= month <= (end.year, end.month):
+            files.append(os.path.join(archive_dir, name))
+    return files
+
+
+# Чтение архивных заявок за период [start_ts, end_ts] построчно, без загрузки файлов целиком
+def load_archive(archive_dir, start_ts, end_ts) -> OrderStore:
+    store = OrderStore()
+    for path in archive_files(archive_dir, start_ts, end_ts):
+        for line in _read_lines(path):
+            order = json.loads(line)
+            timestamp = parse_timestamp(order['datetime'])
+            if not start_ts <= timestamp <= end_ts:
+                continue
+            store.add_chat(order['chat_id'], order['chat_name']).add_order(
+                order['city'],
+                order['address'],
+                timestamp,
+                order['body_count'],
+                order['paid_amount'],
+                order.get('start'),
+            )
+    return store
@@ -0,0 +1,77 @@
+import numpy as np
+
+from orders_store import to_timestamp
+from report_rules import build_city_report, find_duplicates
+
+
+# Заявки города за период в виде колонок NumPy, сгруппированных по адресам подряд:
+# заявки адреса addresses[i] лежат в строках offsets[i]:offsets[i + 1].
+# Границы периода по каждому адресу находятся бинарным поиском по отсортированному времени.
+class CityColumns:
+    __slots__ = ('addresses', 'offsets', 'timestamps', 'paid', 'bodies', 'starts')
+
+    def __init__(self, addresses, start_ts, end_ts):
+        parts = []
+        self.addresses = []
+        for address, orders in addresses.items():
+            lo, hi = orders.bounds(start_ts, end_ts)
+            if lo < hi:
+                self.addresses.append(address)
+                parts.append((orders, lo, hi))
+        self.offsets = np.zeros(len(parts) + 1, dtype=np.int64)
+        np.cumsum([hi - lo for _, lo, hi in parts], out=self.offsets[1:])
+        self.timestamps = _concat([(orders.timestamps, lo, hi) for orders, lo, hi in parts], np.int64)
+        self.paid = _concat([(orders.paid, lo, hi) for orders, lo, hi in parts], np.intc)
+        self.bodies = _concat([(orders.bodies, lo, hi) for orders, lo, hi in parts], np.intc).astype(np.int64)
+        self.starts = [start for orders, lo, hi in parts for start in orders.starts[lo:hi]]
+
+
+def _concat(columns, dtype):
+    # array.array отдаёт буфер без копирования, копия делается один раз при склейке
+    columns = [np.frombuffer(column, dtype=dtype)[lo:hi] for column, lo, hi in columns]
+    if not columns:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(columns)
+
+
+# Расчёт отчёта с той же логикой, что и process_data_python, но агрегаты по адресам
+# считаются групповыми редукциями по колонкам
+def process_data(data, start_date, end_date):
+    report = {}
+    start_ts = to_timestamp(start_date, ceil=True)
+    end_ts = to_timestamp(end_date)
+    for city, addresses in data.items():
+        columns = CityColumns(addresses, start_ts, end_ts)
+        groups_count = len(columns.addresses)
+
+        # Колонки содержат только заявки за период, и у каждого адреса из columns.addresses их не меньше одной
+        if columns.timestamps.size == 0:
+            continue
+        counts = np.diff(columns.offsets)
+        groups = np.repeat(np.arange(groups_count), counts)
+        offsets = columns.offsets.tolist()
+
+        # Дубликаты возможны только на адресах с двумя и более заявками за период
+        keep = np.ones(columns.timestamps.size, dtype=bool)
+        for group in np.flatnonzero(counts > 1).tolist():
+            lo, hi = offsets[group], offsets[group + 1]
+            duplicates = find_duplicates(columns.timestamps[lo:hi].tolist(), columns.starts[lo:hi])
+            keep[lo:hi] = np.logical_not(duplicates)
+
+        # Первая заявка адреса за период никогда не дубликат, поэтому у каждого адреса остаётся хотя бы одна строка
+        kept_counts = np.bincount(groups[keep], minlength=groups_count)
+        kept_offsets = np.concatenate(([0], np.cumsum(kept_counts)[:-1]))
+
+        paid = columns.paid[keep]
+        bodies = columns.bodies[keep]
+        max_paid = np.maximum(np.maximum.reduceat(paid, kept_offsets), 0)
+        max_bodies = np.repeat(np.maximum.reduceat(bodies, kept_offsets), kept_counts)
+        our_buddies = np.add.reduceat(np.where((bodies >= 8) | (bodies == max_bodies), bodies, 0), kept_offsets)
+
+        city_report = build_city_report(
+            dict(zip(columns.addresses, max_paid.tolist())),
+            dict(zip(columns.addresses, our_buddies.tolist())),
+        )
+        if len(city_report['unique_requests_by_price']) > 0 or len(city_report['address_with_people']) > 0:
+            report[city] = city_report
+    return report
@@ -0,0 +1,337 @@
+import heapq
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+import serialization
+
+# Формат даты заявки в orders.json
+DATETIME_FORMAT = "%Y.%m.%d %H:%M:%S"
+
+# Раскладка orders.json в msgpack: колонки адресов целиком, в байтах массивов
+COLUMNS_LAYOUT = 'orders-columns-v1'
+
+# Время заявок хранится как целые секунды от этой даты (без часового пояса,
+# как и строки в orders.json), поэтому преобразование обратимо без потерь
+_EPOCH = datetime(1970, 1, 1)
+
+
+def to_timestamp(date: datetime, ceil=False) -> int:
+    delta = date - _EPOCH
+    seconds = delta.days * 86400 + delta.seconds
+    if ceil and delta.microseconds:
+        seconds += 1
+    return seconds
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    return _EPOCH + timedelta(seconds=timestamp)
+
+
+def parse_timestamp(value: str) -> int:
+    return to_timestamp(datetime.strptime(value, DATETIME_FORMAT))
+
+
+def format_timestamp(timestamp: int) -> str:
+    return from_timestamp(timestamp).strftime(DATETIME_FORMAT)
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+# Заявки одного адреса в виде колонок: время, оплата, кол-во людей и фраза начала.
+# Колонки отсортированы по времени, так что заявки за период находятся бинарным поиском.
+# Фразы начала, города и адреса интернируются — повторяющиеся строки хранятся один раз.
+class AddressOrders:
+    __slots__ = ('timestamps', 'paid', 'bodies', 'starts')
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.paid = array('i')
+        self.bodies = array('i')
+        self.starts = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # Итерация отдаёт кортежи (время, кол-во людей, оплата, фраза начала)
+    def __iter__(self):
+        return zip(self.timestamps, self.bodies, self.paid, self.starts)
+
+    def append(self, timestamp, body_count, paid_amount, start):
+        start = _intern(start)
+        if not self.timestamps or self.timestamps[-1] <= timestamp:
+            self.timestamps.append(timestamp)
+            self.bodies.append(body_count)
+            self.paid.append(paid_amount)
+            self.starts.append(start)
+            return
+        # Заявка из прошлого (например, из архива): вставляем после заявок с тем же временем
+        index = bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(index, timestamp)
+        self.bodies.insert(index, body_count)
+        self.paid.insert(index, paid_amount)
+        self.starts.insert(index, start)
+
+    # Границы строк с временем в [start_ts, end_ts] — O(log n)
+    def bounds(self, start_ts, end_ts):
+        return bisect_left(self.timestamps, start_ts), bisect_right(self.timestamps, end_ts)
+
+    # Заявки за период [start_ts, end_ts] — O(log n + k)
+    def window(self, start_ts, end_ts):
+        lo, hi = self.bounds(start_ts, end_ts)
+        return zip(self.timestamps[lo:hi], self.bodies[lo:hi], self.paid[lo:hi], self.starts[lo:hi])
+
+    # Копия заявок за период [start_ts, end_ts] — копируются только строки периода
+    def period(self, start_ts, end_ts):
+        return self._slice(*self.bounds(start_ts, end_ts))
+
+    def _slice(self, lo, hi):
+        part = AddressOrders()
+        part.timestamps = self.timestamps[lo:hi]
+        part.bodies = self.bodies[lo:hi]
+        part.paid = self.paid[lo:hi]
+        part.starts = self.starts[lo:hi]
+        return part
+
+    # Слияние заявок нескольких адресов по времени (при равном времени — в порядке частей)
+    @classmethod
+    def merged(cls, *parts):
+        merged = cls()
+        for timestamp, body_count, paid_amount, start in heapq.merge(*parts, key=lambda row: row[0]):
+            merged.append(timestamp, body_count, paid_amount, start)
+        return merged
+
+    # Разделение на заявки раньше cutoff и остальные
+    def split(self, cutoff):
+        index = bisect_left(self.timestamps, cutoff)
+        return self._slice(0, index), self._slice(index, len(self))
+
+    @classmethod
+    def from_dicts(cls, orders):
+        address_orders = cls()
+        for order in orders:
+            address_orders.append(
+                parse_timestamp(order['datetime']),
+                order['body_count'],
+                order['paid_amount'],
+                order.get('start'),
+            )
+        return address_orders
+
+    # Восстановление из колонок раскладки COLUMNS_LAYOUT (колонки уже отсортированы по времени)
+    @classmethod
+    def from_columns(cls, timestamps, paid, bodies, starts, byteswap=False):
+        address_orders = cls()
+        address_orders.timestamps.frombytes(timestamps)
+        address_orders.paid.frombytes(paid)
+        address_orders.bodies.frombytes(bodies)
+        if byteswap:
+            address_orders.timestamps.byteswap()
+            address_orders.paid.byteswap()
+            address_orders.bodies.byteswap()
+        address_orders.starts = [_intern(start) for start in starts]
+        return address_orders
+
+    def to_columns(self):
+        return [self.timestamps.tobytes(), self.paid.tobytes(), self.bodies.tobytes(), self.starts]
+
+    def to_dicts(self):
+        orders = []
+        for timestamp, body_count, paid_amount, start in self:
+            order = {
+                'body_count': body_count,
+                'paid_amount': paid_amount,
+                'datetime': format_timestamp(timestamp),
+            }
+            if start is not None:
+                order['start'] = start
+            orders.append(order)
+        return orders
+
+
+# Заявки одного чата: город -> адрес -> AddressOrders
+class ChatOrders:
+    __slots__ = ('chat_name', 'streets')
+
+    def __init__(self, chat_name):
+        self.chat_name = _intern(chat_name)
+        self.streets = {}
+
+    def __len__(self):
+        return sum(len(orders) for addresses in self.streets.values() for orders in addresses.values())
+
+    def add_order(self, city, address, timestamp, body_count, paid_amount, start):
+        addresses = self.streets.setdefault(_intern(city), {})
+        address = _intern(address)
+        orders = addresses.get(address)
+        if orders is None:
+            orders = addresses[address] = AddressOrders()
+        orders.append(timestamp, body_count, paid_amount, start)
+
+
+# Хранилище всех заявок в памяти. Загружается из orders.json и сохраняется в тот же формат.
+class OrderStore:
+    __slots__ = ('chats',)
+
+    def __init__(self):
+        self.chats = {}
+
+    def __len__(self):
+        return sum(len(chat) for chat in self.chats.values())
+
+    def __contains__(self, chat_id):
+        return chat_id in self.chats
+
+    def items(self):
+        return self.chats.items()
+
+    def get(self, chat_id):
+        return self.chats.get(chat_id)
+
+    def add_chat(self, chat_id, chat_name):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = ChatOrders(chat_name)
+        return chat
+
+    # Копия для сохранения в другом потоке: колонки копируются целиком, строки общие.
+    # Намного дешевле to_dict(), поэтому её можно снимать в цикле событий.
+    def snapshot(self):
+        store = OrderStore()
+        for chat_id, chat in self.chats.items():
+            copy = store.add_chat(chat_id, chat.chat_name)
+            for city, addresses in chat.streets.items():
+                copy.streets[city] = {address: orders._slice(0, len(orders)) for address, orders in addresses.items()}
+        return store
+
+    def find_chat_id(self, chat_name):
+        for chat_id, chat in self.chats.items():
+            if chat.chat_name == chat_name:
+                return chat_id
+        return None
+
+    def chat_names(self):
+        return [chat.chat_name for chat in self.chats.values()]
+
+    # Заявки раньше cutoff (копия, хранилище не меняется)
+    def orders_before(self, cutoff):
+        old = OrderStore()
+        for chat_id, chat in self.chats.items():
+            for city, addresses in chat.streets.items():
+                for address, orders in addresses.items():
+                    before, _ = orders.split(cutoff)
+                    if len(before):
+                        old.add_chat(chat_id, chat.chat_name).streets.setdefault(city, {})[address] = before
+        return old
+
+    # Заявки за период [start_ts, end_ts] (копия, хранилище не меняется). Адреса без заявок за период
+    # остаются пустыми, чтобы порядок городов и адресов в отчётах был тем же, что и по всему хранилищу.
+    def period(self, start_ts, end_ts):
+        store = OrderStore()
+        for chat_id, chat in self.chats.items():
+            copy = store.add_chat(chat_id, chat.chat_name)
+            for city, addresses in chat.streets.items():
+                copy.streets[city] = {address: orders.period(start_ts, end_ts) for address, orders in addresses.items()}
+        return store
+
+    # Удаление заявок раньше cutoff; пустые адреса и города убираются, чаты остаются
+    def drop_before(self, cutoff):
+        for chat in self.chats.values():
+            for city in list(chat.streets):
+                addresses = chat.streets[city]
+                for address in list(addresses):
+                    if addresses[address].timestamps[0] >= cutoff:
+                        continue
+                    _, after = addresses[address].split(cutoff)
+                    if len(after):
+                        addresses[address] = after
+                    else:
+                        del addresses[address]
+                if not addresses:
+                    del chat.streets[city]
+
+    # Объединение нескольких хранилищ (заявки одного адреса сливаются по времени)
+    @classmethod
+    def merged(cls, *stores):
+        result = cls()
+        for store in stores:
+            for chat_id, chat in store.chats.items():
+                target = result.add_chat(chat_id, chat.chat_name)
+                for city, addresses in chat.streets.items():
+                    target_addresses = target.streets.setdefault(city, {})
+                    for address, orders in addresses.items():
+                        if address in target_addresses:
+                            target_addresses[address] = AddressOrders.merged(target_addresses[address], orders)
+                        else:
+                            target_addresses[address] = orders
+        return result
+
+    @classmethod
+    def from_dict(cls, raw):
+        store = cls()
+        for chat_id, item in raw.items():
+            chat = store.add_chat(chat_id, item.get('chat_name', ''))
+            for city, addresses in item.get('streets', {}).items():
+                city_orders = chat.streets.setdefault(_intern(city), {})
+                for address, orders in addresses.items():
+                    city_orders[_intern(address)] = AddressOrders.from_dicts(orders)
+        return store
+
+    def to_dict(self):
+        raw = {}
+        for chat_id, chat in self.chats.items():
+            raw[chat_id] = {
+                'streets': {
+                    city: {address: orders.to_dicts() for address, orders in addresses.items()}
+                    for city, addresses in chat.streets.items()
+                },
+                'chat_name': chat.chat_name,
+            }
+        return raw
+
+    @classmethod
+    def from_columns(cls, raw):
+        store = cls()
+        byteswap = raw['byteorder'] != sys.byteorder
+        for chat_id, item in raw['chats'].items():
+            chat = store.add_chat(chat_id, item['chat_name'])
+            for city, addresses in item['streets'].items():
+                city_orders = chat.streets.setdefault(_intern(city), {})
+                for address, columns in addresses.items():
+                    city_orders[_intern(address)] = AddressOrders.from_columns(*columns, byteswap=byteswap)
+        return store
+
+    def to_columns(self):
+        return {
+            'layout': COLUMNS_LAYOUT,
+            'byteorder': sys.byteorder,
+            'chats': {
+                chat_id: {
+                    'chat_name': chat.chat_name,
+                    'streets': {
+                        city: {address: orders.to_columns() for address, orders in addresses.items()}
+                        for city, addresses in chat.streets.items()
+                    },
+                }
+                for chat_id, chat in self.chats.items()
+            },
+        }
+
+    # Формат файла (JSON или msgpack) определяется по содержимому
+    @classmethod
+    def load(cls, path):
+        try:
+            raw = serialization.load(path)
+        except FileNotFoundError:
+            return cls()
+        if raw.get('layout') == COLUMNS_LAYOUT:
+            return cls.from_columns(raw)
+        return cls.from_dict(raw)
+
+    # codec: 'json' (компактный), 'json-indent' или 'msgpack' (колоночная раскладка)
+    def save(self, path, codec='json'):
+        raw = self.to_columns() if codec == 'msgpack' else self.to_dict()
+        serialization.dump(raw, path, codec)
@@ -0,0 +1,150 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Режимы: cProfile (детерминированный, файл .pstats) и выборка стеков (файл collapsed stacks для flamegraph)
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Сообщение asyncio о медленном шаге в режиме отладки: "Executing <Handle ...> took 0.123 seconds"
+_SLOW_CALLBACK_RE = re.compile(r'^Executing (.*) took (\d+(?:\.\d+)?) seconds$', re.S)
+# Корутина задачи в описании шага: "coro=<handle_message() running at bot.py:123>"
+_CORO_RE = re.compile(r'coro=<([^>]*)>')
+
+# Профилирование запускается не чаще одного раза одновременно
+_lock = asyncio.Lock()
+
+
+class ProfileResult:
+    def __init__(self, path, summary):
+        self.path = path
+        self.summary = summary
+
+
+# Сбор сообщений asyncio о медленных шагах корутин (пишутся только в режиме отладки цикла)
+class _SlowCallbackCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.WARNING)
+        self.slow = []
+
+    def emit(self, record):
+        match = _SLOW_CALLBACK_RE.match(record.getMessage())
+        if match:
+            coro = _CORO_RE.search(match.group(1))
+            self.slow.append((float(match.group(2)), coro.group(1) if coro else match.group(1)[:200]))
+
+
+# Выборка стеков потока цикла событий из отдельного потока
+class _StackSampler(threading.Thread):
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _task_counts():
+    return Counter(
+        getattr(task.get_coro(), '__qualname__', type(task.get_coro()).__name__)
+        for task in asyncio.all_tasks()
+    )
+
+
+# Профилирование цикла событий на seconds секунд. Вне этого окна ничего не включено,
+# поэтому в обычной работе накладных расходов нет.
+async def profile_event_loop(seconds, mode='cprofile', output_dir='.', slow_callback_duration=0.05,
+                             sample_interval=0.005) -> ProfileResult:
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Неизвестный режим профилирования: {mode}")
+    if _lock.locked():
+        raise RuntimeError("Профилирование уже запущено")
+
+    async with _lock:
+        loop = asyncio.get_running_loop()
+        collector = _SlowCallbackCollector()
+        asyncio_logger = logging.getLogger('asyncio')
+        previous_debug, previous_duration = loop.get_debug(), loop.slow_callback_duration
+
+        tasks_before = _task_counts()
+        peak_tasks = sum(tasks_before.values())
+        profiler, sampler = None, None
+
+        asyncio_logger.addHandler(collector)
+        loop.set_debug(True)
+        loop.slow_callback_duration = slow_callback_duration
+        if mode == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = _StackSampler(threading.get_ident(), sample_interval)
+            sampler.start()
+        started = time.perf_counter()
+        try:
+            # Раз в секунду считаем задачи, чтобы знать пиковое количество
+            while time.perf_counter() - started < seconds:
+                await asyncio.sleep(min(1.0, seconds - (time.perf_counter() - started)))
+                peak_tasks = max(peak_tasks, len(asyncio.all_tasks()))
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if sampler is not None:
+                sampler.stop()
+            loop.set_debug(previous_debug)
+            loop.slow_callback_duration = previous_duration
+            asyncio_logger.removeHandler(collector)
+
+        tasks_after = _task_counts()
+        stamp = time.strftime('%Y%m%d_%H%M%S')
+        lines = [
+            f"Профилирование ({mode}) {seconds} с",
+            f"Задачи asyncio: было {sum(tasks_before.values())}, стало {sum(tasks_after.values())}, пик {peak_tasks}",
+        ]
+        for name, count in tasks_after.most_common(5):
+            lines.append(f"  {name}: {count}")
+
+        # Медленные шаги по корутинам: кол-во и максимальная длительность
+        slow = {}
+        for duration, description in collector.slow:
+            count, longest = slow.get(description, (0, 0.0))
+            slow[description] = (count + 1, max(longest, duration))
+        lines.append(f"Медленные шаги (> {slow_callback_duration * 1000:.0f} мс): {len(collector.slow)}")
+        for description, (count, longest) in sorted(slow.items(), key=lambda item: item[1][1], reverse=True)[:10]:
+            lines.append(f"  {description}: {count} раз, до {longest * 1000:.0f} мс")
+
+        if profiler is not None:
+            path = os.path.join(output_dir, f"profile_{stamp}.pstats")
+            profiler.dump_stats(path)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(15)
+            lines.append(stream.getvalue())
+        else:
+            path = os.path.join(output_dir, f"profile_{stamp}.collapsed")
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            lines.append(f"Выборок стека: {sum(sampler.stacks.values())}")
+
+        return ProfileResult(path, "\n".join(lines))
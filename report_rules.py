@@ -0,0 +1,152 @@
+import sys
+from functools import lru_cache
+
+from rapidfuzz import fuzz
+
+# Окно (в секундах), в котором похожие по фразе начала заявки считаются дубликатами
+DUPLICATE_WINDOW = 12 * 60 * 60
+
+# Порог сходства фраз начала, выше которого заявки считаются дубликатами
+DUPLICATE_SIMILARITY = 92
+
+# Размер кэша попарного сходства фраз начала
+SIMILARITY_CACHE_SIZE = 16384
+
+# Размер кэша отпечатков фраз начала
+FINGERPRINT_CACHE_SIZE = 16384
+
+# Классы дня во фразе начала (битовые флаги)
+DAY_TODAY = 1
+DAY_TOMORROW = 2
+DAY_ASAP = 4
+
+_DAY_KEYWORDS = (
+    (DAY_TODAY, 'сегодня'),
+    (DAY_TOMORROW, 'завтра'),
+    (DAY_ASAP, 'в_ближайшее_время'),
+)
+
+
+# Отпечаток фразы начала: класс дня и нормализованная фраза (слова через один пробел) с её хэшем.
+# Фразы, совпадающие после нормализации, сравниваются по хэшу без нечёткого сравнения.
+class PhraseFingerprint:
+    __slots__ = ('phrase', 'day_class', 'normalized', 'token_hash')
+
+    def __init__(self, phrase):
+        self.phrase = phrase
+        self.day_class = 0
+        for day_class, keyword in _DAY_KEYWORDS:
+            if keyword in phrase:
+                self.day_class |= day_class
+        self.normalized = ' '.join(phrase.split())
+        self.token_hash = hash(self.normalized)
+
+    # Совпадение после нормализации: сначала сравнение хэшей, строки — только при равных хэшах
+    def same_as(self, other):
+        return self.token_hash == other.token_hash and self.normalized == other.normalized
+
+
+# Отпечаток фразы начала, считается при поступлении заявки, в отчётах берётся из ограниченного кэша
+@lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def fingerprint(phrase):
+    return PhraseFingerprint(sys.intern(phrase))
+
+
+# Нечёткое сходство двух разных фраз (как в process.extractOne), с ограниченным кэшем
+@lru_cache(maxsize=SIMILARITY_CACHE_SIZE)
+def phrase_similarity(phrase, other):
+    return fuzz.WRatio(phrase, other)
+
+
+# Самая близкая по фразе заявка из ранее учтённых: (индекс, сходство) или None.
+# Как и process.extractOne, при равном сходстве выбирается первая.
+# Отличие от extractOne: фразы, различающиеся только пробелами, считаются совпадающими (сходство 100),
+# тогда как WRatio дал бы им чуть меньше 100.
+def _best_match(phrase, duplicate_dates):
+    best_match = None
+    for index, (_, other) in enumerate(duplicate_dates):
+        # Совпадающая после нормализации непустая фраза даёт максимальное сходство 100, дальше искать незачем
+        if phrase.normalized and phrase.same_as(other):
+            return index, 100
+        similarity = phrase_similarity(phrase.phrase, other.phrase)
+        if best_match is None or similarity > best_match[1]:
+            best_match = (index, similarity)
+    return best_match
+
+
+# Поиск дубликатов среди заявок одного адреса (в порядке поступления).
+# Возвращает список флагов: True — заявка повторяет одну из предыдущих и не учитывается.
+def find_duplicates(timestamps, starts):
+    duplicates = []
+    # [(время, отпечаток фразы начала), ...]
+    duplicate_dates = []
+    for order_ts, start in zip(timestamps, starts):
+        if start is None:
+            duplicates.append(False)
+            continue
+        phrase = fingerprint(start)
+        # Находим самый близкий по фразе заказ
+        best_match = _best_match(phrase, duplicate_dates)
+        if best_match is not None:
+            match_index, similarity = best_match
+            match_ts, match_phrase = duplicate_dates[match_index]
+            # Рассчитываем разницу
+            difference = abs(order_ts - match_ts)
+            if (phrase.day_class & DAY_TODAY and match_phrase.day_class & DAY_TOMORROW) or (
+                    phrase.day_class & DAY_ASAP and match_phrase.day_class & DAY_TODAY) or (
+                    similarity > DUPLICATE_SIMILARITY and difference < DUPLICATE_WINDOW):
+                del duplicate_dates[match_index]
+                duplicate_dates.append((order_ts, phrase))
+                duplicates.append(True)
+                continue
+        duplicate_dates.append((order_ts, phrase))
+        duplicates.append(False)
+    return duplicates
+
+
+# Кол-во людей на адресе: все заявки >= 8 человек либо с максимальным значением
+def count_buddies(body_list):
+    mx_body_count = max(body_list)
+    our_buddies = 0
+    for b in body_list:
+        if b >= 8:
+            our_buddies += b
+        elif b == mx_body_count:
+            our_buddies += b
+    return our_buddies
+
+
+# Отчёт по городу из максимальной оплаты и кол-ва людей по адресам
+def build_city_report(max_paid_by_address, buddies_by_address):
+    city_report = {
+        "unique_requests_by_price": {},
+        "address_with_people": {},
+    }
+
+    # Подсчет уникальных цен по заявкам
+    for max_paid in max_paid_by_address.values():
+        if max_paid in city_report['unique_requests_by_price']:
+            city_report['unique_requests_by_price'][max_paid] += 1
+        else:
+            city_report['unique_requests_by_price'][max_paid] = 1
+
+    # считаем адреса с кол-вом заявок >= 8 или максимальным значением
+    add_counter = 0
+    max_bodies_in_adress = 0
+    for our_buddies in buddies_by_address.values():
+        if our_buddies > 8:
+            add_counter += 1
+        max_bodies_in_adress = max(max_bodies_in_adress, our_buddies)
+
+    # Фильтруем: все > 8 либо максимальное колво
+    address_with_people = {}
+    for address, buddies in buddies_by_address.items():
+        if add_counter > 0 and buddies < 8:
+            continue
+        elif add_counter == 0 and buddies != max_bodies_in_adress:
+            continue
+        address_with_people[address] = buddies
+
+    city_report['address_with_people'] = dict(
+        sorted(address_with_people.items(), key=lambda item: item[1], reverse=True))
+    return city_report
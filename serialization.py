@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+
+# Необязательные библиотеки: orjson ускоряет JSON, msgpack нужен для двоичного формата
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# Кодек: имя, преобразование объекта в байты и обратно
+class JsonCodec:
+    name = 'json'
+
+    # Компактный JSON без отступов; через orjson, если он установлен (формат файла тот же)
+    def dumps(self, obj) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(obj)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data: bytes):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data.decode('utf-8'))
+
+
+# JSON с отступами, как раньше писались все файлы бота (удобно читать глазами)
+class IndentedJsonCodec(JsonCodec):
+    name = 'json-indent'
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, indent=4).encode('utf-8')
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+
+    def dumps(self, obj) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, data: bytes):
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), IndentedJsonCodec(), MsgpackCodec())}
+
+# Первые значимые байты JSON-документа; документ msgpack (словарь или список) так начинаться не может
+_JSON_START = b'{["-0123456789tfn'
+
+
+def get_codec(name):
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f"Неизвестный формат: {name} (доступны: {', '.join(CODECS)})")
+    if codec.name == 'msgpack' and msgpack is None:
+        raise ValueError("Для формата msgpack нужно установить пакет msgpack")
+    return codec
+
+
+# Формат по содержимому файла: JSON (с отступами или без) либо msgpack
+def detect_codec(data: bytes):
+    head = data.lstrip()[:1]
+    if not head or head in _JSON_START:
+        return CODECS['json']
+    return get_codec('msgpack')
+
+
+def loads(data: bytes):
+    if data.startswith(b'\xef\xbb\xbf'):
+        data = data[3:]
+    return detect_codec(data).loads(data)
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+# Атомарная запись: сначала во временный файл, затем переименование,
+# чтобы при сбое на диске оставалась предыдущая версия файла
+def dump(obj, path, codec='json'):
+    data = get_codec(codec).dumps(obj)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+# Перевод файла в другой формат:
+#   python serialization.py orders.json --to msgpack --orders
+#   python serialization.py accounts.json --to json-indent -o accounts.pretty.json
+def main():
+    parser = argparse.ArgumentParser(description="Перевод файлов бота в другой формат")
+    parser.add_argument('path')
+    parser.add_argument('--to', required=True, choices=list(CODECS))
+    parser.add_argument('-o', '--output', help="куда записать (по умолчанию на место исходного файла)")
+    parser.add_argument('--orders', action='store_true',
+                        help="файл заявок (для msgpack используется колоночная раскладка OrderStore)")
+    args = parser.parse_args()
+
+    output = args.output or args.path
+    if args.orders:
+        from orders_store import OrderStore
+        store = OrderStore.load(args.path)
+        store.save(output, args.to)
+        print(f"{args.path} -> {output} ({args.to}): заявок {len(store)}, {os.path.getsize(output)} байт")
+    else:
+        dump(load(args.path), output, args.to)
+        print(f"{args.path} -> {output} ({args.to}): {os.path.getsize(output)} байт")
+
+
+if __name__ == '__main__':
+    main()